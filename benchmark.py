@@ -0,0 +1,114 @@
+import json
+import resource
+import sys
+import time
+
+import torch
+
+from comp_offload import CompOffloadingEnv
+from schedule.NAFA import NAFA_Agent
+from schedule.best_fit import best_fit
+from schedule.linUCB import LinUCBAgent
+from schedule.worst_fit import worst_fit
+from util.data_util import read_energy_data
+from util.options import args_parser, benchmark_args_parser
+
+
+# time reset and step of one episode driven by best fit, only the env calls are timed
+def bench_env(env, days, GHI_Data):
+    agent = best_fit(env)
+    start = time.perf_counter()
+    state = env.reset(is_train=True, simulation_start=0, simulation_end=days * 24, GHI_Data=GHI_Data)
+    reset_time = time.perf_counter() - start
+    step_time = 0
+    states = [state]
+    transitions = []
+    done = False
+    while not done:
+        action = agent.act(state)
+        start = time.perf_counter()
+        next_state, reward, done = env.step(action)
+        step_time += time.perf_counter() - start
+        transitions.append((state, action, reward, next_state, done))
+        states.append(next_state)
+        state = next_state
+    return {'reset_time': reset_time, 'steps_per_sec': len(transitions) / step_time}, states, transitions
+
+
+def bench_decisions(agent, states, n_decisions):
+    states = [states[i % len(states)] for i in range(n_decisions)]
+    start = time.perf_counter()
+    for state in states:
+        agent.act(state)
+    return n_decisions / (time.perf_counter() - start)
+
+
+def bench_learning(agent, transitions, n_updates):
+    for transition in transitions:
+        agent.buffer.add(*transition)
+    start = time.perf_counter()
+    for fr in range(1, n_updates + 1):
+        agent.learning(fr)
+    return n_updates / (time.perf_counter() - start)
+
+
+def run_benchmark(bench_args):
+    GHI_Data = read_energy_data(is_train=True)
+    results = {}
+    for lambda_r in bench_args.lambda_r:
+        for days in bench_args.days:
+            args = args_parser([])
+            args.lambda_r = lambda_r
+            # the environment and the agents draw their streams from the benchmark seed
+            args.seed = bench_args.seed
+            args.device = torch.device("cpu")
+            env = CompOffloadingEnv(args)
+            result, states, transitions = bench_env(env, days, GHI_Data)
+            agents = {'NAFA': NAFA_Agent(args, env), 'linUCB': LinUCBAgent(args, env), 'BF': best_fit(env),
+                      'WF': worst_fit(env)}
+            # greedy decisions only, exploration would skip the forward pass
+            agents['NAFA'].is_training = False
+            for name, agent in agents.items():
+                result['{}_decisions_per_sec'.format(name)] = bench_decisions(agent, states, bench_args.n_decisions)
+            result['NAFA_updates_per_sec'] = bench_learning(agents['NAFA'], transitions, bench_args.n_updates)
+            results['lambda{}_days{}'.format(lambda_r, days)] = result
+            print('lambda_r={} days={}: {}'.format(lambda_r, days, result))
+    # ru_maxrss is reported in kilobytes on Linux
+    results['peak_rss_mb'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    return results
+
+
+# relative slowdown of every metric found in both results, times and memory are better when lower
+def compare(results, baseline):
+    slowdown = {}
+    for case, metrics in baseline.items():
+        if case not in results:
+            continue
+        if not isinstance(metrics, dict):
+            slowdown[case] = results[case] / metrics - 1
+            continue
+        for name, value in metrics.items():
+            if name not in results[case]:
+                continue
+            if name.endswith('per_sec'):
+                slowdown['{}/{}'.format(case, name)] = value / results[case][name] - 1
+            else:
+                slowdown['{}/{}'.format(case, name)] = results[case][name] / value - 1
+    return slowdown
+
+
+if __name__ == "__main__":
+    bench_args = benchmark_args_parser()
+    results = run_benchmark(bench_args)
+    if bench_args.output is not None:
+        with open(bench_args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+    if bench_args.baseline is not None:
+        with open(bench_args.baseline, 'r') as f:
+            baseline = json.load(f)
+        regressions = {name: value for name, value in compare(results, baseline).items()
+                       if value > bench_args.threshold}
+        for name, value in sorted(regressions.items()):
+            print('regression {}: {:.1%} slower than baseline'.format(name, value))
+        if regressions:
+            sys.exit(1)
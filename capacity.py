@@ -0,0 +1,210 @@
+import csv
+import hashlib
+import itertools
+import json
+import os
+import pickle
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+import torch
+
+from comp_offload import CompOffloadingEnv
+from fast_forward import FastForwardSimulator
+from schedule.NAFA import NAFA_Agent
+from schedule.best_fit import best_fit
+from schedule.linUCB import LinUCBAgent
+from schedule.worst_fit import worst_fit
+from sweep import load_spec
+from util.data_util import read_energy_data
+from util.options import args_parser, capacity_args_parser
+
+HARDWARE = ['panel_size', 'battery_size', 'core_number', 'kappa', 'frequency_set']
+KEYS = ['method', 'lambda_r', 'tradeoff', 'trial', 'seed'] + HARDWARE
+COLUMNS = KEYS + ['days', 'accept', 'average_reward', 'n_total_request', 'n_reject_low_power',
+                  'n_reject_conservation', 'n_reject_high_latency', 'total_latency', 'wall_time',
+                  'off_training_hardware', 'error']
+
+# request streams and GHI trace drawn once by the parent and handed to every worker at start up
+worker_data = {}
+
+
+# options of one grid point
+def point_args(config):
+    args = args_parser([])
+    for key, value in config.items():
+        setattr(args, key, value)
+    args.device = torch.device("cpu")
+    return args
+
+
+def model_path(config):
+    if config['method'] == 'NAFA':
+        return 'data/model_{}_{}_{}.pkl'.format(config['lambda_r'], config['tradeoff'], config['trial'])
+    return 'data/linucb_{}_{}_{}.pkl'.format(config['lambda_r'], config['tradeoff'], config['trial'])
+
+
+# state and action sizes the trained model of a grid point was built for, None if the model is missing
+def model_dims(config):
+    path = model_path(config)
+    if not os.path.exists(path):
+        return None
+    if config['method'] == 'NAFA':
+        weights = [value for name, value in torch.load(path).items() if name.endswith('weight')]
+        return weights[0].shape[1], weights[-1].shape[0]
+    with open(path, 'rb') as f:
+        matrix_H = np.asarray(pickle.load(f)[0])
+    return matrix_H.shape[-1], len(matrix_H)
+
+
+# the model files are only named by lambda_r, tradeoff and trial, they are taken as trained on the default hardware
+# of main.py. Elsewhere they still run if the sizes match, but the running instances are normalized by another
+# capacity and the policy was never trained on the energy and core budget it decides for
+def off_training_hardware(config):
+    if config['method'] in ['BF', 'WF']:
+        return False
+    defaults = args_parser([])
+    return any(config[key] != getattr(defaults, key) for key in HARDWARE)
+
+
+# expand the grid into one option dict per grid point, scalar spec entries apply to every grid point.
+# NAFA and linUCB points whose state or action size differs from their trained model can not run, they are
+# returned apart with the reason
+def expand_grid(capacity_args):
+    grid = {key: getattr(capacity_args, key) for key in KEYS if key != 'frequency_set'}
+    grid['frequency_set'] = [args_parser([]).frequency_set]
+    if capacity_args.spec is not None:
+        grid.update(load_spec(capacity_args.spec))
+    # a single frequency set is a list of numbers, a grid of them a list of lists
+    if not isinstance(grid['frequency_set'][0], list):
+        grid['frequency_set'] = [grid['frequency_set']]
+    axes = [key for key in grid if isinstance(grid[key], list)]
+    fixed = {key: value for key, value in grid.items() if key not in axes}
+    configs = []
+    skipped = []
+    for values in itertools.product(*[grid[key] for key in axes]):
+        config = dict(fixed)
+        config.update(zip(axes, values))
+        # the trained model does not matter to the threshold policies
+        if config['method'] in ['BF', 'WF']:
+            config['trial'] = None
+        config['days'] = capacity_args.days
+        if config in configs or config in [point for point, reason in skipped]:
+            continue
+        if config['method'] not in ['BF', 'WF']:
+            env = CompOffloadingEnv(point_args(config))
+            dims = (env.observation_space.shape[0], env.action_space.n)
+            trained_dims = model_dims(config)
+            if trained_dims is not None and tuple(trained_dims) != dims:
+                skipped.append((config, 'state and action sizes {} differ from the trained model {} ({})'.format(
+                    dims, tuple(trained_dims), model_path(config))))
+                continue
+        configs.append(config)
+    return configs, skipped
+
+
+# file caching the result of one grid point, named by a digest of its configuration
+def cache_path(cache, config):
+    digest = hashlib.sha1(json.dumps(config, sort_keys=True, default=str).encode()).hexdigest()
+    return os.path.join(cache, digest + '.json')
+
+
+# draw the request stream of one arrival rate and seed, every grid point with them replays it
+def draw_stream(lambda_r, seed, days):
+    env = CompOffloadingEnv(args_parser(['--lambda_r', str(lambda_r)]))
+    env.simulation_start = 0
+    env.simulation_end = days * 24
+    env.request_rng = np.random.default_rng(seed)
+    return env.draw_request_stream()
+
+
+def init_worker(streams, GHI_test):
+    torch.set_num_threads(1)
+    worker_data['streams'] = streams
+    worker_data['test'] = GHI_test
+
+
+# evaluate one policy on one hardware configuration over the shared request stream
+def run_config(config):
+    args = point_args(config)
+    start = time.time()
+    env = CompOffloadingEnv(args)
+    env.request_stream = worker_data['streams'][(config['lambda_r'], config['seed'])]
+    GHI_test = worker_data['test']
+    if config['method'] in ['BF', 'WF']:
+        agent = best_fit(env) if config['method'] == 'BF' else worst_fit(env)
+        env = FastForwardSimulator(env, agent)
+        env.run(is_train=False, simulation_start=0, simulation_end=config['days'] * 24, GHI_Data=GHI_test)
+    else:
+        if config['method'] == 'NAFA':
+            agent = NAFA_Agent(args, env)
+            agent.load_weights(model_path(config))
+        else:
+            agent = LinUCBAgent(args, env)
+            agent.load_model()
+        s = env.reset(is_train=False, simulation_start=0, simulation_end=config['days'] * 24, GHI_Data=GHI_test)
+        done = False
+        while not done:
+            s, r, done = env.step(agent.act(s))
+    result = dict(config)
+    result.update({'average_reward': np.mean(env.day_rewards), 'n_total_request': np.sum(env.n_total_request),
+                   'n_reject_low_power': np.sum(env.n_reject_low_power),
+                   'n_reject_conservation': np.sum(env.n_reject_conservation),
+                   'n_reject_high_latency': np.sum(env.n_reject_high_latency),
+                   'total_latency': np.sum(env.total_latency), 'wall_time': time.time() - start})
+    result['accept'] = result['n_total_request'] - result['n_reject_low_power'] - \
+        result['n_reject_conservation'] - result['n_reject_high_latency']
+    return {key: value.item() if isinstance(value, np.generic) else value for key, value in result.items()}
+
+
+def write_cache(path, result):
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(result, f)
+    os.replace(tmp_path, path)
+
+
+if __name__ == "__main__":
+    capacity_args = capacity_args_parser()
+    os.makedirs(capacity_args.cache, exist_ok=True)
+    configs, skipped = expand_grid(capacity_args)
+    for config, reason in skipped:
+        print("skipped {}: {}".format({key: config[key] for key in KEYS}, reason))
+    results = {}
+    for i, config in enumerate(configs):
+        if os.path.exists(cache_path(capacity_args.cache, config)):
+            with open(cache_path(capacity_args.cache, config), 'r') as f:
+                results[i] = json.load(f)
+    pending = [i for i in range(len(configs)) if i not in results]
+    print("{} grid points to simulate, {} cached, {} skipped".format(len(pending), len(results), len(skipped)))
+    if pending:
+        # one request stream per arrival rate and seed, shared by every hardware configuration and policy
+        streams = {}
+        for i in pending:
+            key = (configs[i]['lambda_r'], configs[i]['seed'])
+            if key not in streams:
+                streams[key] = draw_stream(key[0], key[1], capacity_args.days)
+        GHI_test = read_energy_data(is_train=False)
+        with ProcessPoolExecutor(max_workers=capacity_args.workers, initializer=init_worker,
+                                 initargs=(streams, GHI_test)) as executor:
+            futures = {executor.submit(run_config, configs[i]): i for i in pending}
+            for future in as_completed(futures):
+                i = futures[future]
+                try:
+                    results[i] = future.result()
+                except Exception as error:
+                    # a failed grid point is reported in the table instead of aborting the grid, it is not cached
+                    # so the next run retries it
+                    results[i] = dict(configs[i], error=repr(error))
+                    print("failed {}: {!r}".format({key: configs[i][key] for key in KEYS}, error))
+                    continue
+                # every grid point is cached as soon as it finishes, so refining the grid only adds new points
+                write_cache(cache_path(capacity_args.cache, configs[i]), results[i])
+                print("finished {}".format({key: configs[i][key] for key in KEYS}))
+    with open(capacity_args.output, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=COLUMNS, extrasaction='ignore')
+        writer.writeheader()
+        rows = [results[i] for i in range(len(configs))] + [dict(config, error=reason) for config, reason in skipped]
+        for row in rows:
+            writer.writerow(dict(row, off_training_hardware=off_training_hardware(row)))
@@ -0,0 +1,189 @@
+import heapq
+import numpy as np
+from comp_offload import CompOffloadingEnv
+from schedule.dispatch import DISPATCH_POLICIES
+
+
+# Environment of a cluster of solar-powered edge servers behind one dispatcher.
+# Every node has the cores and frequencies of CompOffloadingEnv but its own panel size, battery and GHI trace.
+# The status of the nodes is kept in NumPy arrays under one global event timeline: the cluster-wide request
+# stream, the hourly energy changes of all nodes and a heap of task finishes. At each request arrival the
+# dispatch policy picks a node and the agent decides the frequency on that node, so the states, actions and
+# rewards are those of the single server environment.
+class ClusterOffloadingEnv(CompOffloadingEnv):
+
+    def __init__(self, args, n_nodes=None, panel_size=None, battery_size=None, dispatch=None):
+        super(ClusterOffloadingEnv, self).__init__(args)
+        assert self.queue_size == 0, "the cluster environment has no waiting queue"
+        assert self.forecast is None, "the cluster environment has no forecast features"
+        self.n_nodes = n_nodes if n_nodes is not None else args.n_nodes
+        if panel_size is None:
+            panel_size = args.node_panel_size if args.node_panel_size is not None else float(args.panel_size)
+        if battery_size is None:
+            battery_size = args.node_battery_size if args.node_battery_size is not None else self.battery_size
+        self.node_panel_size = np.broadcast_to(np.asarray(panel_size, dtype=float), [self.n_nodes]).copy()
+        self.node_battery_size = np.broadcast_to(np.asarray(battery_size, dtype=float), [self.n_nodes]).copy()
+        # the largest battery keeps the states of every node inside the observation space
+        self.battery_size = np.max(self.node_battery_size)
+        self.observation_space.high[1:3] = self.battery_size
+        self.state_scale[1:3] = self.battery_size
+        # every node sees the per-server arrival rate
+        self.lambda_request = args.lambda_r * self.n_nodes
+        self.dispatcher = DISPATCH_POLICIES[dispatch if dispatch is not None else args.dispatch](self)
+
+    # requests of the cluster are not traced
+    def open_trace(self, trace_path):
+        return None
+
+    # hourly energy produce rates of every node, GHI_data is one trace shared by the nodes or one row per node
+    def gen_energy_produce_change(self, GHI_data):
+        GHI_data = np.asarray(GHI_data, dtype=float)
+        if GHI_data.ndim == 1:
+            GHI_data = GHI_data[None, :]
+        GHI_data = np.broadcast_to(GHI_data[:, self.simulation_start:self.simulation_end],
+                                   [self.n_nodes, self.simulation_end - self.simulation_start])
+        # one column per hour
+        self.energy_change_rate = np.ascontiguousarray((3600 * self.node_panel_size[:, None] * GHI_data).T)
+        self.energy_index = 0
+
+    # integrate battery and reservation status of every node up to time t
+    def integrate_energy(self, t):
+        elapsed = t - self.node_counter
+        self.battery_status = np.maximum(self.battery_status - self.core_power * elapsed, 0)
+        self.battery_status = np.minimum(self.battery_status + self.energy_produce_rate * elapsed,
+                                         self.node_battery_size)
+        self.reservation_status = np.maximum(self.reservation_status - self.core_power * elapsed, 0)
+        self.node_counter[:] = t
+
+    # integrate the status of one node up to time t, cheaper with python floats than with array operations
+    def integrate_node_energy(self, node, t):
+        elapsed = t - self.node_counter[node]
+        core_power = self.core_power[node]
+        battery_status = max(self.battery_status[node] - core_power * elapsed, 0)
+        self.battery_status[node] = min(battery_status + self.energy_produce_rate[node] * elapsed,
+                                        self.node_battery_size[node])
+        self.reservation_status[node] = max(self.reservation_status[node] - core_power * elapsed, 0)
+        self.node_counter[node] = t
+
+    # move the cluster to the next request arrival and dispatch it.
+    # the nodes are integrated lazily: at their own task finishes, at the energy changes and when the request
+    # reaches them, or every node at each request when the dispatch policy reads the status of the cluster
+    def update_post_action_status(self):
+        request_time = self.request_time[self.request_index]
+        n_hour = len(self.energy_change_rate)
+        while True:
+            energy_time = self.simulation_start + self.energy_index if self.energy_index < n_hour else np.inf
+            finish_time = self.finish_queue[0][0] if self.finish_queue else np.inf
+            # request arrivals win ties, energy events were queued before task finishes
+            if min(energy_time, finish_time) >= request_time:
+                break
+            if energy_time <= finish_time:
+                self.integrate_energy(energy_time)
+                self.energy_produce_rate = self.energy_change_rate[self.energy_index]
+                self.energy_index += 1
+            else:
+                _, _, node, action = heapq.heappop(self.finish_queue)
+                self.integrate_node_energy(node, finish_time)
+                self.running_instance[node, action - 1] -= 1
+                self.n_running[node] -= 1
+                # reset the running sum once idle so that rounding errors cannot accumulate
+                self.core_power[node] = self.core_power[node] - self.frequency_power[action - 1] \
+                    if self.n_running[node] > 0 else 0.0
+        self.counter = request_time
+        if self.dispatcher.reads_status:
+            self.integrate_energy(request_time)
+            self.node = self.dispatcher.select(self.request_data_size[self.request_index])
+        else:
+            self.node = self.dispatcher.select(self.request_data_size[self.request_index])
+            self.integrate_node_energy(self.node, request_time)
+
+    # perform action on the node the current request was dispatched to
+    def step(self, action):
+        node = self.node
+        possible_actions = self.action_mask(self.current_status_to_state())
+        assert possible_actions[action], "action: '{}' is invalid in state '{}'".format(action,
+                                                                                        self.current_status_to_state())
+        # update the statistic record data
+        if (self.counter - self.simulation_start) > 24 * self.day:
+            self.day += 1
+        self.n_total_request[self.day - 1] += 1
+        self.node_requests[node] += 1
+
+        data_size = self.request_data_size[self.request_index]
+        if action == 0:  # the request is rejected
+            reward = 0
+            # rejection resulted from energy overbooked
+            least_frequency = np.min(self.frequency_set)
+            least_reserved_energy = self.kappa * least_frequency ** 3 * (data_size * self.complexity / least_frequency)
+            if self.reservation_status[node] + least_reserved_energy > self.battery_status[node]:
+                self.n_reject_low_power[self.day - 1] += 1
+            # no core is free,then it must be rejected by overloaded
+            elif self.n_running[node] == self.core_number:
+                self.n_reject_high_latency[self.day - 1] += 1
+            # there are other possble actions, it must be rejected due to conservation
+            else:
+                self.n_reject_conservation[self.day - 1] += 1
+        else:
+            self.node_accepts[node] += 1
+            frequency = self.frequency_set[action - 1]
+            process_time = data_size * self.complexity / (frequency * 3600)
+            reward = 1 - (self.args.tradeoff * process_time)
+            self.total_latency[self.day - 1] += process_time
+            self.reservation_status[node] += self.kappa * frequency ** 3 * data_size * self.complexity / frequency
+            self.running_instance[node, action - 1] += 1
+            self.n_running[node] += 1
+            self.core_power[node] += self.frequency_power[action - 1]
+            self.finish_sequence += 1
+            heapq.heappush(self.finish_queue, (self.counter + process_time, self.finish_sequence, node, action))
+
+        self.day_rewards[self.day - 1] += reward
+        self.request_index += 1
+        self.update_post_action_status()
+        is_terminal = self.counter > self.simulation_end
+        return self.current_status_to_state(), reward, is_terminal
+
+    # reset the cluster, GHI_Data is one trace shared by the nodes or a (n_nodes, hours) array
+    def reset(self, is_train, simulation_start, simulation_end, GHI_Data):
+        self.seed_episode(is_train)
+        self.simulation_start = simulation_start
+        self.simulation_end = simulation_end
+        self.counter = float(simulation_start)
+        # time up to which the status of each node is integrated
+        self.node_counter = np.full(self.n_nodes, float(simulation_start))
+        self.energy_produce_rate = np.zeros(self.n_nodes)
+        self.battery_status = np.zeros(self.n_nodes)
+        self.reservation_status = np.zeros(self.n_nodes)
+        self.running_instance = np.zeros([self.n_nodes, len(self.frequency_set)])
+        self.core_power = np.zeros(self.n_nodes)
+        self.n_running = np.zeros(self.n_nodes, dtype=int)
+        # heap of (finish time, sequence, node, action), the sequence keeps the push order among equal times
+        self.finish_queue = []
+        self.finish_sequence = 0
+        self.request_index = 0
+        self.node = 0
+
+        ###########################
+        # statistic data for recording purpose, cluster-wide per day and per node over the episode
+        day_num = int((simulation_end - simulation_start) / 24)
+        self.total_latency = np.zeros([day_num])
+        self.n_reject_conservation = np.zeros([day_num])
+        self.n_total_request = np.zeros([day_num])
+        self.n_reject_low_power = np.zeros([day_num])
+        self.n_reject_high_latency = np.zeros([day_num])
+        self.day_rewards = np.zeros([day_num])
+        self.day = 0
+        self.node_requests = np.zeros(self.n_nodes, dtype=int)
+        self.node_accepts = np.zeros(self.n_nodes, dtype=int)
+        ###########################
+        self.gen_request()
+        self.gen_energy_produce_change(GHI_Data)
+        self.dispatcher.reset()
+        # find the first request arrival event
+        self.update_post_action_status()
+        return self.current_status_to_state()
+
+    # state of the node serving the current request, laid out as the state of the single server environment
+    def current_status_to_state(self):
+        node = self.node
+        return np.concatenate([[self.counter % 24], [self.battery_status[node]], [self.reservation_status[node]],
+                               self.running_instance[node], [self.request_data_size[self.request_index]]])
@@ -3,6 +3,11 @@ import gym
 from gym import spaces
 import numpy as np
 import heapq
+from util.data_util import read_clear_sky
+from util.forecast import SOLAR_CONSTANT, forecast_features
+from util.seeding import ENV_STREAM, seed_sequence
+from util.trace import RequestTraceRecorder, ACCEPTED, REJECT_LOW_POWER, REJECT_CONSERVATION, \
+    REJECT_HIGH_LATENCY, REJECT_DEADLINE
 
 
 # event queues record the event happening order
@@ -18,6 +23,12 @@ class event_queue():
     def pop(self):
         return heapq.heappop(self._queue)[-1]
 
+    # arrival time of the earliest event, inf if the queue is empty
+    def peek_time(self):
+        if len(self._queue) == 0:
+            return np.inf
+        return self._queue[0][0]
+
 
 # class of system events
 class event:
@@ -41,33 +52,84 @@ class event:
 # Training/testing environment for adaptive frequency adjustment in computation offloading scenario
 class CompOffloadingEnv(gym.Env):
 
-    def __init__(self, args):
-        self.kappa = 1e-28
+    def __init__(self, args, sequence=None):
+        self.kappa = args.kappa
         self.complexity = 20000
         self.avg_data_size = 20 * 8 * 1e6  # 20MB
-        self.battery_size = 1e6
-        self.core_number = 12
-        self.frequency_set = np.array([2e9, 3e9, 4e9])
+        self.battery_size = args.battery_size
+        self.core_number = args.core_number
+        self.frequency_set = np.array(args.frequency_set, dtype=float)
+        # power drawn by one core running at each frequency
+        self.frequency_power_factor = self.kappa * self.frequency_set ** 3
+        self.frequency_power = self.frequency_power_factor * 3600
+        self.frequency_list = list(zip(self.frequency_power_factor.tolist(), self.frequency_set.tolist()))
         self.lambda_request = args.lambda_r
-        low = np.concatenate([[0], [0], [0], np.zeros(len(self.frequency_set)), [self.avg_data_size - 10 * 8 * 1e6]])
+        self.panel_size = args.panel_size
+        # optional bounded queue of accepted requests waiting for a free core, a request still waiting
+        # queue_deadline hours after its arrival is dropped. capacity counts the running and waiting tasks
+        self.queue_size = args.queue_size
+        self.queue_deadline = args.queue_deadline
+        self.capacity = self.core_number + self.queue_size
+        # optional solar lookahead features appended after the data size, the energy the panel is forecast to
+        # produce over each horizon. size_index is the position of the data size in the state
+        self.forecast = args.forecast
+        self.forecast_horizons = list(args.forecast_horizons) if self.forecast is not None else []
+        # the clear-sky forecast reads the clear-sky column of the trace the GHI comes from
+        self.trace_paths = {True: args.train_trace, False: args.test_trace}
+        self.forecast_scale = 3600 * self.panel_size * SOLAR_CONSTANT * np.array(self.forecast_horizons, dtype=float)
+        self.forecast_source = None
+        self.size_index = 3 + len(self.frequency_set)
+        low = np.concatenate([[0], [0], [0], np.zeros(len(self.frequency_set)), [self.avg_data_size - 10 * 8 * 1e6],
+                              np.zeros(len(self.forecast_horizons))])
         high = np.concatenate(
             [[24], [self.battery_size], [self.battery_size], self.core_number * np.zeros(len(self.frequency_set)),
-             [self.avg_data_size + 10 * 8 * 1e6]])
+             [self.avg_data_size + 10 * 8 * 1e6], self.forecast_scale])
         self.action_space = spaces.Discrete(len(self.frequency_set) + 1)
         self.observation_space = spaces.Box(low, high, dtype=np.float32)
-        self.panel_size = args.panel_size
+        # offset and range of every state entry: hour, battery, reservation, running instances, data size and the
+        # optional forecast features, the learning agents scale their states to [0, 1] with them
+        n_frequency = len(self.frequency_set)
+        self.state_offset = np.concatenate([[0, 0, 0], np.zeros(n_frequency), [self.avg_data_size - 10 * 8 * 1e6],
+                                            np.zeros(len(self.forecast_horizons))])
+        self.state_scale = np.concatenate(
+            [[24, self.battery_size, self.battery_size], np.full(n_frequency, self.capacity),
+             [(self.avg_data_size + 10 * 8 * 1e6) - (self.avg_data_size - 10 * 8 * 1e6)], self.forecast_scale])
         self.args = args
+        self.trace = self.open_trace(args.trace_path)
+        # request stream shared by several configurations (common random numbers), None draws a new one per reset
+        self.request_stream = None
+        # generator of the training request streams, owned by the environment
+        self.train_rng = np.random.default_rng(sequence if sequence is not None else seed_sequence(args, ENV_STREAM))
+        self.test_seed = args.test_seed
+        self.request_rng = self.train_rng
+
+    # draw one stream of request arrival times and data sizes in bulk, ending with the first request after the end
+    def draw_request_stream(self):
+        horizon = self.simulation_end - self.simulation_start
+        n_request = int(self.lambda_request * horizon + 5 * np.sqrt(self.lambda_request * horizon)) + 1
+        # cumulative sum of Exponential(_lambda) inter-arrival times
+        arrival_time = self.simulation_start + np.cumsum(self.request_rng.exponential(1 / self.lambda_request,
+                                                                                    size=n_request))
+        # keep drawing until one request arrives after the end of the simulation
+        while arrival_time[-1] < self.simulation_end:
+            extra = arrival_time[-1] + np.cumsum(self.request_rng.exponential(1 / self.lambda_request,
+                                                                              size=n_request))
+            arrival_time = np.concatenate([arrival_time, extra])
+        n_request = np.searchsorted(arrival_time, self.simulation_end) + 1
+        data_size = self.request_rng.uniform(self.avg_data_size - 10 * 8 * 1e6, self.avg_data_size + 10 * 8 * 1e6,
+                                      size=n_request)
+        return arrival_time[:n_request], data_size
+
+    # training episodes continue the request stream of the environment, every testing episode replays the
+    # stream of test_seed so that all methods are tested on the same requests
+    def seed_episode(self, is_train):
+        self.request_rng = self.train_rng if is_train else np.random.default_rng(self.test_seed)
 
     def gen_request(self):
-        _lambda = self.lambda_request
-        _arrival_time = self.simulation_start
-        while _arrival_time < self.simulation_end:
-            # Plug it into the inverse of the CDF of Exponential(_lamnbda)
-            _inter_arrival_time = np.random.exponential(1 / _lambda, size=1)[0]
-            # Add the inter-arrival time to the running sum
-            _arrival_time = _arrival_time + _inter_arrival_time
-            datasize = np.random.uniform(self.avg_data_size - 10 * 8 * 1e6, self.avg_data_size + 10 * 8 * 1e6)
-            self.event_queue.push(event(0, _arrival_time, datasize))
+        if self.request_stream is not None:
+            self.request_time, self.request_data_size = self.request_stream
+        else:
+            self.request_time, self.request_data_size = self.draw_request_stream()
 
     def gen_task_finish(self, target_core, data_size, action):
         assert action >= 1
@@ -80,51 +142,133 @@ class CompOffloadingEnv(gym.Env):
 
     # generate the event when energy consumption change
     def gen_energy_produce_change(self, GHI_data):
-        for i in range(self.simulation_start, self.simulation_end):
-            energy_produce_rate = 3600 * self.panel_size * GHI_data[i] / 1
-            self.event_queue.push(event(1, i, energy_produce_rate))
+        self.energy_change_time = np.arange(self.simulation_start, self.simulation_end)
+        self.energy_change_rate = 3600 * self.panel_size * np.asarray(GHI_data[self.simulation_start:
+                                                                                self.simulation_end]) / 1
+
+    # lookahead features of every hour of the GHI trace, computed once per trace and reused by every episode on it
+    def gen_forecast(self, GHI_data, is_train):
+        if self.forecast is None or GHI_data is self.forecast_source:
+            return
+        clear_sky = None
+        if self.forecast == 'clear_sky':
+            clear_sky = read_clear_sky(is_train, path=self.trace_paths[is_train])
+            assert len(clear_sky) == len(GHI_data), "the GHI data is not the trace of --train_trace or --test_trace"
+        self.forecast_table = 3600 * self.panel_size * forecast_features(GHI_data, self.forecast,
+                                                                         self.forecast_horizons, clear_sky)
+        self.forecast_last = len(self.forecast_table) - 1
+        self.forecast_source = GHI_data
+
+    # lookahead features at time t, the row of its hour of the trace
+    def forecast_state(self, t):
+        return self.forecast_table[min(int(t), self.forecast_last)]
+
+    # merge request arrivals and energy changes into one sorted timeline, requests win ties
+    def gen_timeline(self):
+        n_request = len(self.request_time)
+        time = np.concatenate([self.request_time, self.energy_change_time])
+        order = np.argsort(time, kind='stable')
+        self.timeline_time = time[order]
+        self.timeline_name = np.where(order < n_request, 0, 1)
+        self.timeline_msg = np.concatenate([self.request_data_size, self.energy_change_rate])[order]
+        self.timeline_index = 0
 
     def update_post_action_status(self):
 
         # do not break the iteration until a request comes!
         while True:
-            next_event = self.event_queue.pop()
+            # task finish events are the only ones kept in the heap, timeline events win ties
+            finish_time = self.event_queue.peek_time()
+            timeline_time = self.timeline_time[self.timeline_index]
+            if self.waiting and self.waiting[0][0] < min(finish_time, timeline_time):
+                # the longest waiting request misses its deadline
+                event_name, event_time, event_msg = -1, self.waiting[0][0], 0
+            elif finish_time < timeline_time:
+                next_event = self.event_queue.pop()
+                event_name, event_time, event_msg = next_event.name, next_event.arrival_time, next_event.extra_msg
+            else:
+                event_name = self.timeline_name[self.timeline_index]
+                event_time = self.timeline_time[self.timeline_index]
+                event_msg = self.timeline_msg[self.timeline_index]
+                self.timeline_index += 1
             # update the battery status
-            core_power = np.sum(self.kappa * self.core_frequency ** 3 * 3600)
-            self.battery_status = max(self.battery_status - core_power * (next_event.arrival_time - self.counter), 0)
+            core_power = self.core_power
+            self.battery_status = max(self.battery_status - core_power * (event_time - self.counter), 0)
             self.battery_status = min(
-                self.battery_status + self.energy_produce_rate * (next_event.arrival_time - self.counter),
+                self.battery_status + self.energy_produce_rate * (event_time - self.counter),
                 self.battery_size)
             # unlock the reservation energy
             self.reservation_status = max(
-                self.reservation_status - core_power * (next_event.arrival_time - self.counter), 0)
+                self.reservation_status - core_power * (event_time - self.counter), 0)
+            self.counter = event_time
 
-            if next_event.name == 1:
+            if event_name == -1:
+                self.drop_waiting()
+
+            if event_name == 1:
                 # update the energy produce rate if the arrived event is energy produce rate change
-                new_energy_produce_rate = next_event.extra_msg
+                new_energy_produce_rate = event_msg
                 self.energy_produce_rate = new_energy_produce_rate
 
             # task finish
-            if 2 <= next_event.name < 2 + self.core_number:
-                core = (next_event.name - 2)
+            if 2 <= event_name < 2 + self.core_number:
+                core = (event_name - 2)
                 # make core into sleeping status
-                action = next_event.extra_msg
+                action = event_msg
                 self.core_frequency[core] = 0
                 self.running_instance[action - 1] -= 1
-            self.counter = next_event.arrival_time
-            self.event = next_event
-            if self.event.name == 0:
+                self.n_running -= 1
+                heapq.heappush(self.free_core, core)
+                # reset the running sum once idle so that rounding errors cannot accumulate
+                self.core_power = self.core_power - self.frequency_power[action - 1] if self.n_running > 0 else 0.0
+                if self.waiting:
+                    self.start_waiting()
+            if event_name == 0:
+                self.event = event(0, event_time, event_msg)
                 break
         assert self.event.name == 0
         return
 
+    # start the earliest deadline waiting request on the core which just became free,
+    # its queueing delay is added to the latency and charged to the reward of the current step
+    def start_waiting(self):
+        _, _, arrival_time, data_size, action, day = heapq.heappop(self.waiting)
+        delay = self.counter - arrival_time
+        self.total_latency[day] += delay
+        self.total_queue_delay[day] += delay
+        self.day_rewards[day] -= self.args.tradeoff * delay
+        self.pending_reward -= self.args.tradeoff * delay
+        self.n_running += 1
+        self.core_power += self.frequency_power[action - 1]
+        target_core = heapq.heappop(self.free_core)
+        self.core_frequency[target_core] = self.frequency_set[action - 1]
+        self.gen_task_finish(target_core, data_size, action)
+
+    # drop the waiting request which missed its deadline, it ends like a rejected request:
+    # its reserved energy is released and its admission reward and latency are taken back
+    def drop_waiting(self):
+        _, _, arrival_time, data_size, action, day = heapq.heappop(self.waiting)
+        frequency = self.frequency_set[action - 1]
+        process_time = data_size * self.complexity / (frequency * 3600)
+        reward = 1 - (self.args.tradeoff * process_time)
+        self.total_latency[day] -= process_time
+        self.day_rewards[day] -= reward
+        self.pending_reward -= reward
+        self.n_reject_deadline[day] += 1
+        self.running_instance[action - 1] -= 1
+        self.reservation_status = max(
+            self.reservation_status - self.kappa * frequency ** 3 * data_size * self.complexity / frequency, 0)
+        if self.trace is not None:
+            self.trace.record(self.counter, data_size, self.battery_status, self.reservation_status, self.n_running,
+                              action, REJECT_DEADLINE, 0, -reward)
+
     # perform action in the training environment
     def step(self, action):
         # other inner events cannot be exposed to outside
         assert self.event.name == 0
-        possible_actions = self.possible_action_given_state(self.current_status_to_state())
-        assert action in possible_actions, "action: '{}' is invalid in state '{}'".format(action,
-                                                                                          self.current_status_to_state())
+        possible_actions = self.action_mask(self.current_status_to_state())
+        assert possible_actions[action], "action: '{}' is invalid in state '{}'".format(action,
+                                                                                        self.current_status_to_state())
         # update the statistic record data
         if (self.counter - self.simulation_start) > 24 * self.day:
             self.day += 1
@@ -132,22 +276,30 @@ class CompOffloadingEnv(gym.Env):
 
         data_size = self.event.extra_msg
 
+        if self.trace is not None:
+            battery_status, reservation_status, n_running = self.battery_status, self.reservation_status, self.n_running
+
         if action == 0:  # the request is rejected
             reward = 0
+            process_time = 0
             # rejection resulted from energy overbooked
             least_frequency = np.min(self.frequency_set)
             least_reserved_energy = self.kappa * least_frequency ** 3 * (data_size * self.complexity / least_frequency)
             if self.reservation_status + least_reserved_energy > self.battery_status:
                 self.n_reject_low_power[self.day - 1] += 1
+                reject_reason = REJECT_LOW_POWER
             else:
-                # no core is free,then it must be rejected by overloaded
-                if np.sum(self.running_instance) == self.core_number:
+                # no core (or place in the waiting queue) is free,then it must be rejected by overloaded
+                if self.n_running + len(self.waiting) == self.capacity:
                     self.n_reject_high_latency[self.day - 1] += 1
+                    reject_reason = REJECT_HIGH_LATENCY
                 # there are other possble actions, it must be rejected due to conservation
                 else:
-                    assert len(possible_actions) != 0
+                    assert np.any(possible_actions[1:])
                     self.n_reject_conservation[self.day - 1] += 1
+                    reject_reason = REJECT_CONSERVATION
         else:
+            reject_reason = ACCEPTED
 
             frequency = self.frequency_set[action - 1]
             process_time = data_size * self.complexity / (frequency * 3600)
@@ -158,16 +310,30 @@ class CompOffloadingEnv(gym.Env):
             self.total_latency[self.day - 1] += process_time
             self.reservation_status += self.kappa * frequency ** 3 * data_size * self.complexity / frequency
             self.running_instance[action - 1] += 1
-            # find the first sleeping core
-            for i in range(len(self.core_frequency)):
-                if self.core_frequency[i] == 0:
-                    target_core = i
-                    break
-            self.core_frequency[target_core] = frequency
-            self.gen_task_finish(target_core, data_size, action)
+            if self.n_running < self.core_number:
+                self.n_running += 1
+                self.core_power += self.frequency_power[action - 1]
+                # take the first sleeping core
+                target_core = heapq.heappop(self.free_core)
+                self.core_frequency[target_core] = frequency
+                self.gen_task_finish(target_core, data_size, action)
+            else:
+                # every core is busy, the request waits in the queue ordered by deadline
+                self.waiting_sequence += 1
+                heapq.heappush(self.waiting, (self.counter + self.queue_deadline, self.waiting_sequence, self.counter,
+                                              data_size, action, self.day - 1))
+                self.n_queued[self.day - 1] += 1
 
         self.day_rewards[self.day - 1] += reward
+        self.last_reject_reason = reject_reason
+        if self.trace is not None:
+            self.trace.record(self.counter, data_size, battery_status, reservation_status, n_running, action,
+                              reject_reason, process_time, reward)
         self.update_post_action_status()
+        # queueing delays and deadline drops happening before the next request
+        if self.pending_reward != 0:
+            reward += self.pending_reward
+            self.pending_reward = 0.0
         if self.counter > self.simulation_end:
             is_terminal = True
         else:
@@ -178,8 +344,7 @@ class CompOffloadingEnv(gym.Env):
 
     # reset the current environment status
     def reset(self, is_train, simulation_start, simulation_end, GHI_Data):
-        if not is_train:
-            np.random.seed(0)
+        self.seed_episode(is_train)
         self.simulation_start = simulation_start
         self.simulation_end = simulation_end
         # initialize counter
@@ -188,12 +353,20 @@ class CompOffloadingEnv(gym.Env):
         self.energy_produce_rate = 0
         # initialize core frequency
         self.core_frequency = np.zeros(self.core_number)
+        # initialize sleeping cores ordered by index, total core power and number of running tasks
+        self.free_core = list(range(self.core_number))
+        self.core_power = 0.0
+        self.n_running = 0
         # initialize energy reservation queue
         self.reservation_status = 0
         # initialize battery_status
         self.battery_status = 0
         # initialize frequency type
         self.running_instance = np.zeros(len(self.frequency_set))
+        # initialize waiting queue, a heap of (deadline, sequence, arrival time, data size, action, day)
+        self.waiting = []
+        self.waiting_sequence = 0
+        self.pending_reward = 0.0
 
         ###########################
         # statistic data for recording purpose
@@ -204,12 +377,19 @@ class CompOffloadingEnv(gym.Env):
         self.n_reject_low_power = np.zeros([day_num])
         self.n_reject_high_latency = np.zeros([day_num])
         self.day_rewards = np.zeros([day_num])
+        self.n_queued = np.zeros([day_num])
+        self.n_reject_deadline = np.zeros([day_num])
+        self.total_queue_delay = np.zeros([day_num])
         self.day = 0
         ###########################
         # initialize request and energy event
         self.event_queue = event_queue()
         self.gen_request()
         self.gen_energy_produce_change(GHI_Data)
+        self.gen_forecast(GHI_Data, is_train)
+        self.gen_timeline()
+        if self.trace is not None:
+            self.trace.new_episode()
         # find the first request arrival event
         self.update_post_action_status()
         return self.current_status_to_state()
@@ -222,27 +402,203 @@ class CompOffloadingEnv(gym.Env):
         state = np.concatenate(
             [[self.counter % 24], [self.battery_status], [self.reservation_status], self.running_instance,
              [event.extra_msg]])
+        if self.forecast is not None:
+            state = np.concatenate([state, self.forecast_state(self.counter)])
         return deepcopy(state)
 
-    # filter invalid action given state
-    def filterInvalidAction(self, state):
-        battery_status = state[1]
-        reservation_status = state[2]
-        running_instance = state[3:-1]
-        data_size = state[-1]
-        actions = set()
-        for frequency_index, frequency in enumerate(self.frequency_set):
-            needed_reserve_energy = self.kappa * frequency ** 3 * data_size * self.complexity / frequency
-            if reservation_status + needed_reserve_energy > battery_status:
-                actions.add(frequency_index + 1)
-            if np.sum(running_instance) == self.core_number:
-                actions.add(frequency_index + 1)
-        return actions
-
-    def possible_action_given_state(self, state):
-        invalid = self.filterInvalidAction(state)
-        possible_action = set()
-        possible_action.add(0)
-        for frequency_index in range(1, len(self.frequency_set) + 1):
-            possible_action.add(frequency_index)
-        return possible_action - invalid
+    # boolean mask of the actions allowed in each state, rejection (action 0) is always allowed.
+    # states is either one state or a (B, obs_dim) array, the mask has shape (n_actions,) or (B, n_actions)
+    def action_mask(self, states):
+        states = np.asarray(states)
+        if states.ndim == 1:
+            # a single state is cheaper to check with python floats than with small array operations
+            state = states.tolist()
+            size_index = self.size_index
+            if sum(state[3:size_index]) == self.capacity:
+                return np.array([True] + [False] * len(self.frequency_list))
+            return np.array([True] + [state[2] + power_factor * state[size_index] * self.complexity / frequency
+                                      <= state[1] for power_factor, frequency in self.frequency_list])
+        needed_reserve_energy = self.frequency_power_factor * states[:, self.size_index:self.size_index + 1] * \
+            self.complexity / self.frequency_set
+        accept = (states[:, 2:3] + needed_reserve_energy <= states[:, 1:2]) & (
+                np.sum(states[:, 3:self.size_index], axis=1, keepdims=True) != self.capacity)
+        return np.concatenate([np.ones([len(states), 1], dtype=bool), accept], axis=1)
+
+    # optional per-request trace, None keeps step free of any recording work
+    def open_trace(self, trace_path):
+        if trace_path is None:
+            return None
+        return RequestTraceRecorder(trace_path)
+
+    # write out the pending part of the request trace
+    def close(self):
+        if self.trace is not None:
+            self.trace.close()
+
+
+# Vectorized environment which steps N independent simulations in lockstep.
+# Every replica shares the configuration of CompOffloadingEnv, but its battery, reservation, core and running
+# instance status are kept as rows of NumPy arrays, so one step decides one request for every replica at once.
+class BatchedCompOffloadingEnv(CompOffloadingEnv):
+
+    def __init__(self, args, n_envs):
+        super(BatchedCompOffloadingEnv, self).__init__(args)
+        assert self.queue_size == 0, "the batched environment has no waiting queue"
+        assert self.forecast is None, "the batched environment has no forecast features"
+        self.n_envs = n_envs
+
+    # requests of the replicas are not traced
+    def open_trace(self, trace_path):
+        return None
+
+    # draw the request arrival times and data sizes of every replica in bulk
+    def gen_request(self):
+        arrival_times = []
+        data_sizes = []
+        for _ in range(self.n_envs):
+            arrival_time, data_size = self.draw_request_stream()
+            arrival_times.append(arrival_time)
+            data_sizes.append(data_size)
+        # pad the request streams to a rectangle, the padding never becomes the next request
+        max_request = max(len(_arrival_time) for _arrival_time in arrival_times)
+        self.request_time = np.full([self.n_envs, max_request], np.inf)
+        self.request_data_size = np.zeros([self.n_envs, max_request])
+        for i in range(self.n_envs):
+            self.request_time[i, :len(arrival_times[i])] = arrival_times[i]
+            self.request_data_size[i, :len(data_sizes[i])] = data_sizes[i]
+
+    # integrate battery and reservation status of the masked replicas up to time t
+    def integrate_energy(self, mask, t):
+        elapsed = np.where(mask, t - self.counter, 0)
+        self.battery_status = np.maximum(self.battery_status - self.core_power * elapsed, 0)
+        self.battery_status = np.minimum(self.battery_status + self.energy_produce_rate * elapsed, self.battery_size)
+        self.reservation_status = np.maximum(self.reservation_status - self.core_power * elapsed, 0)
+        self.counter = np.where(mask, t, self.counter)
+
+    # move the masked replicas to their next request arrival, handling energy and task finish events in between
+    def update_post_action_status(self, mask):
+        rows = np.arange(self.n_envs)
+        request_time = self.request_time[rows, self.request_index]
+        while True:
+            energy_time = np.where(self.energy_index < self.simulation_end - self.simulation_start,
+                                   self.simulation_start + self.energy_index, np.inf)
+            finish_core = np.argmin(self.core_finish_time, axis=1)
+            finish_time = self.core_finish_time[rows, finish_core]
+            next_time = np.minimum(energy_time, finish_time)
+            # request arrivals win ties, energy events were queued before task finishes
+            pending = mask & (next_time < request_time)
+            if not np.any(pending):
+                break
+            self.integrate_energy(pending, next_time)
+
+            is_energy = pending & (energy_time <= finish_time)
+            hour = self.simulation_start + self.energy_index[is_energy]
+            self.energy_produce_rate[is_energy] = 3600 * self.panel_size * self.GHI_Data[hour] / 1
+            self.energy_index[is_energy] += 1
+
+            # make the finished cores into sleeping status
+            finished = np.nonzero(pending & ~is_energy)[0]
+            core = finish_core[finished]
+            action = self.core_action[finished, core]
+            self.running_instance[finished, action - 1] -= 1
+            self.n_running[finished] -= 1
+            self.core_power[finished] -= self.frequency_power[action - 1]
+            # reset the running sum once idle so that rounding errors cannot accumulate
+            self.core_power[finished[self.n_running[finished] == 0]] = 0
+            self.core_frequency[finished, core] = 0
+            self.core_finish_time[finished, core] = np.inf
+        self.integrate_energy(mask, request_time)
+
+    # perform one action per replica, the actions of terminated replicas are ignored
+    def step(self, actions):
+        actions = np.asarray(actions, dtype=int)
+        active = ~self.done
+        rows = np.arange(self.n_envs)
+        states = self.current_status_to_state()
+        valid = self.action_mask(states)
+        assert np.all(valid[rows[active], actions[active]]), "actions '{}' are invalid in states '{}'".format(
+            actions[active], states[active])
+        # update the statistic record data
+        self.day += active & ((self.counter - self.simulation_start) > 24 * self.day)
+        day = self.day - 1
+        self.n_total_request[rows[active], day[active]] += 1
+
+        data_size = self.request_data_size[rows, self.request_index]
+        accept = active & (actions != 0)
+        reject = active & (actions == 0)
+
+        # rejection resulted from energy overbooked
+        least_frequency = np.min(self.frequency_set)
+        least_reserved_energy = self.kappa * least_frequency ** 3 * (data_size * self.complexity / least_frequency)
+        low_power = reject & (self.reservation_status + least_reserved_energy > self.battery_status)
+        # no core is free,then it must be rejected by overloaded
+        high_latency = reject & ~low_power & (self.n_running == self.core_number)
+        # there are other possble actions, it must be rejected due to conservation
+        conservation = reject & ~low_power & ~high_latency
+        self.n_reject_low_power[rows[low_power], day[low_power]] += 1
+        self.n_reject_high_latency[rows[high_latency], day[high_latency]] += 1
+        self.n_reject_conservation[rows[conservation], day[conservation]] += 1
+
+        frequency = self.frequency_set[np.maximum(actions, 1) - 1]
+        process_time = data_size * self.complexity / (frequency * 3600)
+        rewards = np.where(accept, 1 - (self.args.tradeoff * process_time), 0)
+        self.total_latency[rows[accept], day[accept]] += process_time[accept]
+        self.reservation_status = np.where(accept, self.reservation_status + self.kappa * frequency ** 3 * data_size
+                                           * self.complexity / frequency, self.reservation_status)
+        accepted = rows[accept]
+        self.running_instance[accepted, actions[accept] - 1] += 1
+        self.n_running[accepted] += 1
+        self.core_power[accepted] += self.frequency_power[actions[accept] - 1]
+        # find the first sleeping core
+        target_core = np.argmax(self.core_frequency[accepted] == 0, axis=1)
+        self.core_frequency[accepted, target_core] = frequency[accept]
+        self.core_finish_time[accepted, target_core] = self.counter[accept] + process_time[accept]
+        self.core_action[accepted, target_core] = actions[accept]
+
+        self.day_rewards[rows[active], day[active]] += rewards[active]
+        self.request_index += active
+        self.update_post_action_status(active)
+        self.done = self.done | (self.counter > self.simulation_end)
+        return self.current_status_to_state(), rewards, self.done.copy()
+
+    # reset all replicas
+    def reset(self, is_train, simulation_start, simulation_end, GHI_Data):
+        self.seed_episode(is_train)
+        self.simulation_start = simulation_start
+        self.simulation_end = simulation_end
+        self.GHI_Data = GHI_Data
+        self.counter = np.full(self.n_envs, float(simulation_start))
+        self.energy_produce_rate = np.zeros(self.n_envs)
+        self.core_frequency = np.zeros([self.n_envs, self.core_number])
+        self.core_finish_time = np.full([self.n_envs, self.core_number], np.inf)
+        self.core_action = np.zeros([self.n_envs, self.core_number], dtype=int)
+        self.reservation_status = np.zeros(self.n_envs)
+        self.battery_status = np.zeros(self.n_envs)
+        self.running_instance = np.zeros([self.n_envs, len(self.frequency_set)])
+        self.core_power = np.zeros(self.n_envs)
+        self.n_running = np.zeros(self.n_envs, dtype=int)
+        self.energy_index = np.zeros(self.n_envs, dtype=int)
+        self.request_index = np.zeros(self.n_envs, dtype=int)
+        self.done = np.zeros(self.n_envs, dtype=bool)
+
+        ###########################
+        # statistic data for recording purpose, one row per replica
+        day_num = int((simulation_end - simulation_start) / 24)
+        self.total_latency = np.zeros([self.n_envs, day_num])
+        self.n_reject_conservation = np.zeros([self.n_envs, day_num])
+        self.n_total_request = np.zeros([self.n_envs, day_num])
+        self.n_reject_low_power = np.zeros([self.n_envs, day_num])
+        self.n_reject_high_latency = np.zeros([self.n_envs, day_num])
+        self.day_rewards = np.zeros([self.n_envs, day_num])
+        self.day = np.zeros(self.n_envs, dtype=int)
+        ###########################
+        self.gen_request()
+        # find the first request arrival event
+        self.update_post_action_status(~self.done)
+        return self.current_status_to_state()
+
+    # transfer current environment status of every replica to a (N, obs_dim) state array
+    def current_status_to_state(self):
+        data_size = self.request_data_size[np.arange(self.n_envs), self.request_index]
+        return np.concatenate([(self.counter % 24)[:, None], self.battery_status[:, None],
+                               self.reservation_status[:, None], self.running_instance, data_size[:, None]], axis=1)
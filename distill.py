@@ -0,0 +1,122 @@
+import time
+
+import numpy as np
+import torch
+
+from comp_offload import CompOffloadingEnv
+from schedule.NAFA import NAFA_Agent
+from schedule.NAFA_numpy import NAFA_NumpyPolicy
+from schedule.NAFA_table import NAFA_TablePolicy, table_features
+from util.data_util import read_energy_data
+from util.options import args_parser, distill_args_parser
+
+
+def table_path(args):
+    return "data/table_{}_{}_{}.npz".format(args.lambda_r, args.tradeoff, str(args.trial))
+
+
+# run a policy over consecutive monthly windows or one testing period, return the visited states and actions
+def rollout(env, policy, GHI_Data, is_train, windows):
+    states = []
+    actions = []
+    for simulation_start, simulation_end in windows:
+        s = env.reset(is_train=is_train, simulation_start=simulation_start, simulation_end=simulation_end,
+                      GHI_Data=GHI_Data)
+        done = False
+        while not done:
+            action = policy.act(s)
+            states.append(s)
+            actions.append(action)
+            s, r, done = env.step(action)
+    return np.array(states), np.array(actions)
+
+
+# Q values of the network in chunks, the grid of cell centers holds close to a million states
+def q_values(policy, states, chunk=65536):
+    return np.concatenate([policy.q_values(states[i:i + chunk]) for i in range(0, len(states), chunk)])
+
+
+# state at the center of every cell, the running instances of a cell are spread evenly over the frequencies and
+# the forecast features, which the table does not see, take the given values
+def cell_centers(bins, lows, highs, n_frequency, forecast):
+    index = np.stack(np.unravel_index(np.arange(np.prod(bins)), bins), axis=1)
+    features = lows + (index + 0.5) * (highs - lows) / bins
+    running = index[:, 3]
+    instances = running[:, None] // n_frequency + (np.arange(n_frequency) < running[:, None] % n_frequency)
+    return np.concatenate([features[:, :3], instances, features[:, 4:], np.tile(forecast, (len(index), 1))], axis=1)
+
+
+# rank the actions of every cell by the Q values of the network averaged over the visited states of the cell,
+# cells no visited state falls into are ranked by the Q values at their center under the average forecast
+def build_table(policy, states, bins, lows, highs, n_frequency):
+    n_cells = int(np.prod(bins))
+    size_index = 3 + n_frequency
+    q_center = q_values(policy, cell_centers(bins, lows, highs, n_frequency, states[:, size_index + 1:].mean(axis=0)))
+    index = np.clip(np.floor((table_features(states, size_index) - lows) * bins / (highs - lows)).astype(int), 0,
+                    bins - 1)
+    cells = np.ravel_multi_index(index.T, bins)
+    q_visited = q_values(policy, states)
+    counts = np.bincount(cells, minlength=n_cells)
+    q_sum = np.stack([np.bincount(cells, weights=q_visited[:, a], minlength=n_cells)
+                      for a in range(q_visited.shape[1])], axis=1)
+    visited = counts > 0
+    q_cell = np.where(visited[:, None], q_sum / np.maximum(counts, 1)[:, None], q_center)
+    table = np.argsort(-q_cell, axis=1, kind='stable').astype(np.uint8)
+    return table, np.mean(visited)
+
+
+# mean time of one decision over the given states
+def decision_time(policy, states):
+    start = time.perf_counter()
+    for s in states:
+        policy.act(s)
+    return (time.perf_counter() - start) / len(states)
+
+
+if __name__ == "__main__":
+    distill_args = distill_args_parser()
+    argv = ['--lambda_r', str(distill_args.lambda_r), '--tradeoff', str(distill_args.tradeoff),
+            '--trial', str(distill_args.trial)]
+    if distill_args.forecast is not None:
+        argv += ['--forecast', distill_args.forecast, '--forecast_horizons'] + \
+            [str(horizon) for horizon in distill_args.forecast_horizons]
+    args = args_parser(argv)
+    args.device = torch.device("cpu")
+    output = distill_args.output if distill_args.output is not None else table_path(args)
+    env = CompOffloadingEnv(args)
+    agent = NAFA_Agent(args, env)
+    agent.load_weights("data/model_{}_{}_{}.pkl".format(args.lambda_r, args.tradeoff, str(args.trial)))
+    numpy_path = "data/model_{}_{}_{}.npz".format(args.lambda_r, args.tradeoff, str(args.trial))
+    agent.export_numpy(numpy_path)
+    network = NAFA_NumpyPolicy(env, numpy_path)
+
+    # the table is fit on the training trace and judged on the testing trace
+    GHI_train = read_energy_data(is_train=True)
+    GHI_test = read_energy_data(is_train=False)
+    train_windows = [(ep_num * 30 * 24, (ep_num + 1) * 30 * 24) for ep_num in range(distill_args.episodes)]
+    train_states, train_actions = rollout(env, network, GHI_train, True, train_windows)
+    bins = np.array([distill_args.hour_bins, distill_args.battery_bins, distill_args.reservation_bins,
+                     env.capacity + 1, distill_args.size_bins])
+    lows = np.array([0, 0, 0, 0, env.avg_data_size - 10 * 8 * 1e6])
+    highs = np.array([24, env.battery_size, env.battery_size, env.capacity + 1, env.avg_data_size + 10 * 8 * 1e6])
+    table, coverage = build_table(network, train_states, bins, lows, highs, len(env.frequency_set))
+    np.savez(output, table=table, bins=bins, lows=lows, highs=highs)
+    print("table {} with {} cells ({:.1%} visited), {} bytes".format(output, len(table), coverage, table.nbytes))
+
+    # agreement on the states of the network's own runs, reward of both policies on the same testing stream
+    test_windows = [(0, distill_args.test_days * 24)]
+    start = time.time()
+    table_policy = NAFA_TablePolicy(env, output)
+    print("table loaded in {:.2f}ms".format((time.time() - start) * 1000))
+    print("training agreement {:.4f}".format(np.mean(table_policy.act_many(train_states) == train_actions)))
+    test_states, test_actions = rollout(env, network, GHI_test, False, test_windows)
+    network_reward = np.mean(env.day_rewards)
+    print("testing agreement {:.4f}".format(np.mean(table_policy.act_many(test_states) == test_actions)))
+    rollout(env, table_policy, GHI_test, False, test_windows)
+    table_reward = np.mean(env.day_rewards)
+    print("average reward: network {:.4f} table {:.4f} gap {:.4f} ({:.2%})".format(
+        network_reward, table_reward, network_reward - table_reward,
+        (network_reward - table_reward) / abs(network_reward)))
+    timed = test_states[:10000]
+    print("decision time: network {:.2f}us table {:.2f}us".format(decision_time(network, timed) * 1e6,
+                                                                   decision_time(table_policy, timed) * 1e6))
@@ -0,0 +1,161 @@
+import csv
+import json
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+import torch
+
+from comp_offload import CompOffloadingEnv
+from fast_forward import FastForwardSimulator
+from schedule.NAFA import NAFA_Agent
+from schedule.NAFA_numpy import NAFA_NumpyPolicy
+from schedule.best_fit import best_fit
+from schedule.linUCB import LinUCBAgent
+from schedule.worst_fit import worst_fit
+from util.data_util import read_energy_data
+from util.options import args_parser, evaluate_args_parser
+
+METRICS = ['average_reward', 'accept_ratio', 'average_latency', 'low_power_ratio', 'high_latency_ratio']
+COLUMNS = ['method', 'seed', 'window'] + METRICS + ['wall_time']
+
+# options and GHI trace handed to every worker at start up, the request stream of the last unit is kept
+worker_data = {}
+
+
+# options of the evaluated configuration
+def make_args(eval_args):
+    args = args_parser(['--lambda_r', str(eval_args.lambda_r), '--tradeoff', str(eval_args.tradeoff),
+                        '--trial', str(eval_args.trial)])
+    args.device = torch.device("cpu")
+    return args
+
+
+def numpy_model_path(args):
+    return "data/model_{}_{}_{}.npz".format(args.lambda_r, args.tradeoff, str(args.trial))
+
+
+# request stream of one seed and GHI window, every method evaluated on the unit replays it
+def draw_stream(env, seed, window, window_days):
+    env.simulation_start = window * window_days * 24
+    env.simulation_end = (window + 1) * window_days * 24
+    env.request_rng = np.random.default_rng(np.random.SeedSequence(seed, spawn_key=(window,)))
+    return env.draw_request_stream()
+
+
+def init_worker(args, GHI_test, window_days):
+    torch.set_num_threads(1)
+    worker_data['args'] = args
+    worker_data['test'] = GHI_test
+    worker_data['window_days'] = window_days
+    worker_data['stream'] = (None, None)
+
+
+# run one method over the request stream of one (seed, window) unit
+def run_unit(method, seed, window):
+    args = worker_data['args']
+    window_days = worker_data['window_days']
+    start = time.time()
+    env = CompOffloadingEnv(args)
+    if worker_data['stream'][0] != (seed, window):
+        worker_data['stream'] = ((seed, window), draw_stream(env, seed, window, window_days))
+    env.request_stream = worker_data['stream'][1]
+    simulation_start, simulation_end = window * window_days * 24, (window + 1) * window_days * 24
+    if method in ['BF', 'WF']:
+        agent = best_fit(env) if method == 'BF' else worst_fit(env)
+        env = FastForwardSimulator(env, agent)
+        env.run(is_train=False, simulation_start=simulation_start, simulation_end=simulation_end,
+                GHI_Data=worker_data['test'])
+    else:
+        if method == 'NAFA':
+            agent = NAFA_NumpyPolicy(env, numpy_model_path(args))
+        else:
+            agent = LinUCBAgent(args, env)
+            agent.load_model()
+        s = env.reset(is_train=False, simulation_start=simulation_start, simulation_end=simulation_end,
+                      GHI_Data=worker_data['test'])
+        done = False
+        while not done:
+            s, r, done = env.step(agent.act(s))
+    n_total = np.sum(env.n_total_request)
+    n_reject = np.sum(env.n_reject_low_power) + np.sum(env.n_reject_conservation) + np.sum(env.n_reject_high_latency)
+    n_accept = n_total - n_reject
+    return {'method': method, 'seed': seed, 'window': window, 'average_reward': float(np.mean(env.day_rewards)),
+            'accept_ratio': float(n_accept / n_total),
+            'average_latency': float(np.sum(env.total_latency) / max(n_accept, 1)),
+            'low_power_ratio': float(np.sum(env.n_reject_low_power) / n_total),
+            'high_latency_ratio': float(np.sum(env.n_reject_high_latency) / n_total),
+            'wall_time': time.time() - start}
+
+
+# percentile bootstrap interval of the mean of every column of values (n_unit, n_metric)
+def bootstrap_interval(values, n_bootstrap, confidence, rng):
+    index = rng.integers(0, len(values), size=(n_bootstrap, len(values)))
+    means = values[index].mean(axis=1)
+    tail = (1 - confidence) / 2 * 100
+    return np.percentile(means, tail, axis=0), np.percentile(means, 100 - tail, axis=0)
+
+
+# means and bootstrap intervals of every method, and of its paired difference to the reference method.
+# the units are resampled jointly, so the differences keep the pairing of the shared request streams
+def summarize(rows, methods, reference, n_bootstrap, confidence, seed):
+    units = sorted(set((row['seed'], row['window']) for row in rows))
+    unit_index = {unit: i for i, unit in enumerate(units)}
+    values = np.full([len(methods), len(units), len(METRICS)], np.nan)
+    for row in rows:
+        values[methods.index(row['method']), unit_index[(row['seed'], row['window'])]] = [row[m] for m in METRICS]
+    rng = np.random.default_rng(seed)
+    summary = {}
+    for i, method in enumerate(methods):
+        low, high = bootstrap_interval(values[i], n_bootstrap, confidence, rng)
+        summary[method] = {metric: {'mean': values[i, :, j].mean(), 'low': low[j], 'high': high[j]}
+                           for j, metric in enumerate(METRICS)}
+        if method != reference and reference in methods:
+            difference = values[i] - values[methods.index(reference)]
+            low, high = bootstrap_interval(difference, n_bootstrap, confidence, rng)
+            summary['{}-{}'.format(method, reference)] = {
+                metric: {'mean': difference[:, j].mean(), 'low': low[j], 'high': high[j]}
+                for j, metric in enumerate(METRICS)}
+    return summary
+
+
+def print_summary(summary, confidence):
+    print('{:<14}'.format('') + ''.join('{:>36}'.format(metric) for metric in METRICS))
+    for name, metrics in summary.items():
+        print('{:<14}'.format(name) + ''.join('{:>36}'.format('{:.5g} [{:.5g}, {:.5g}]'.format(
+            metrics[m]['mean'], metrics[m]['low'], metrics[m]['high'])) for m in METRICS))
+    print('{:.0%} percentile bootstrap intervals'.format(confidence))
+
+
+if __name__ == "__main__":
+    eval_args = evaluate_args_parser()
+    args = make_args(eval_args)
+    GHI_test = read_energy_data(is_train=False)
+    if 'NAFA' in eval_args.method:
+        # the workers run the trained network through the torch-free policy
+        agent = NAFA_Agent(args, CompOffloadingEnv(args))
+        agent.load_weights("data/model_{}_{}_{}.pkl".format(args.lambda_r, args.tradeoff, str(args.trial)))
+        agent.export_numpy(numpy_model_path(args))
+    seeds = range(eval_args.seed, eval_args.seed + eval_args.n_seeds)
+    # consecutive tasks share a unit, so a worker mostly reuses the request stream it drew last
+    tasks = [(method, seed, window) for seed in seeds for window in range(eval_args.n_windows)
+             for method in eval_args.method]
+    start = time.time()
+    rows = []
+    with ProcessPoolExecutor(max_workers=eval_args.workers, initializer=init_worker,
+                             initargs=(args, GHI_test, eval_args.window_days)) as executor:
+        futures = [executor.submit(run_unit, *task) for task in tasks]
+        for future in as_completed(futures):
+            rows.append(future.result())
+    print('{} runs in {:.1f}s'.format(len(rows), time.time() - start))
+    rows.sort(key=lambda row: (row['seed'], row['window'], eval_args.method.index(row['method'])))
+    with open(eval_args.output, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=COLUMNS)
+        writer.writeheader()
+        writer.writerows(rows)
+    summary = summarize(rows, eval_args.method, eval_args.reference, eval_args.n_bootstrap, eval_args.confidence,
+                        eval_args.seed)
+    print_summary(summary, eval_args.confidence)
+    if eval_args.summary is not None:
+        with open(eval_args.summary, 'w') as f:
+            json.dump(summary, f, indent=2)
@@ -0,0 +1,306 @@
+import heapq
+import time
+
+import numpy as np
+
+from cluster_offload import ClusterOffloadingEnv
+from comp_offload import CompOffloadingEnv
+from schedule.best_fit import best_fit
+from schedule.worst_fit import worst_fit
+from util.data_util import read_energy_data
+from util.options import args_parser
+
+
+# Fast-forward simulation of CompOffloadingEnv for threshold policies such as best_fit and worst_fit, which take
+# their preferred action whenever it is feasible and reject only when no action is. A run of requests which all get
+# the preferred action (or which all get rejected) is advanced with array operations over the sorted arrivals,
+# hourly energy changes and task finishes: the running tasks and the reservation follow cumulative sums and the
+# battery recurrence b = min(b + produced - consumed, battery_size) has a closed form through a running maximum.
+# A run stops at the first request whose constraints bind or where the battery would run empty, from there the
+# simulation continues event by event exactly as the environment does.
+class FastForwardSimulator():
+
+    def __init__(self, env, agent, max_chunk=4096, min_chunk=16):
+        assert env.queue_size == 0, "the fast-forward simulation has no waiting queue"
+        assert not isinstance(env, ClusterOffloadingEnv), "the fast-forward simulation runs a single server"
+        self.env = env
+        self.agent = agent
+        self.preferred_action = agent.preferred_action
+        self.max_chunk = max_chunk
+        self.min_chunk = min_chunk
+        self.queue_size = 0
+        self.least_action = int(np.argmin(env.frequency_set)) + 1
+
+    # energy reserved by requests of the given data sizes at the frequency of action
+    def reserved_energy(self, action, data_size):
+        env = self.env
+        return env.frequency_power_factor[action - 1] * data_size * env.complexity / env.frequency_set[action - 1]
+
+    # integrate battery and reservation status up to time t
+    def integrate_energy(self, t):
+        elapsed = t - self.counter
+        self.battery_status = max(self.battery_status - self.core_power * elapsed, 0)
+        self.battery_status = min(self.battery_status + self.energy_produce_rate * elapsed, self.env.battery_size)
+        self.reservation_status = max(self.reservation_status - self.core_power * elapsed, 0)
+        self.counter = t
+
+    # process the energy changes and task finishes before time t, then integrate up to t
+    def advance(self, t):
+        n_hour = len(self.energy_change_rate)
+        while True:
+            energy_time = self.simulation_start + self.energy_index if self.energy_index < n_hour else np.inf
+            finish_time = self.tasks[0][0] if self.tasks else np.inf
+            # request arrivals win ties, energy events were queued before task finishes
+            if min(energy_time, finish_time) >= t:
+                break
+            if energy_time <= finish_time:
+                self.integrate_energy(energy_time)
+                self.energy_produce_rate = self.energy_change_rate[self.energy_index]
+                self.energy_index += 1
+            else:
+                _, _, action = heapq.heappop(self.tasks)
+                self.integrate_energy(finish_time)
+                self.running_instance[action - 1] -= 1
+                self.n_running -= 1
+                self.core_power = self.core_power - self.env.frequency_power[action - 1] if self.n_running > 0 else 0.0
+        self.integrate_energy(t)
+
+    # state of request k, built from one python list as most requests of busy servers are stepped exactly
+    def current_status_to_state(self, k):
+        state = np.array([self.counter % 24, self.battery_status, self.reservation_status] +
+                         self.running_instance.tolist() + [self.data_size[k]])
+        if self.env.forecast is not None:
+            state = np.concatenate([state, self.env.forecast_state(self.counter)])
+        return state
+
+    # apply the action of request k exactly as CompOffloadingEnv.step
+    def apply(self, k, action):
+        env = self.env
+        day = self.request_day[k]
+        data_size = self.data_size[k]
+        self.n_total_request[day] += 1
+        if action == 0:
+            if self.reservation_status + self.reserved_energy(self.least_action, data_size) > self.battery_status:
+                self.n_reject_low_power[day] += 1
+            elif self.n_running == env.core_number:
+                self.n_reject_high_latency[day] += 1
+            else:
+                self.n_reject_conservation[day] += 1
+            return
+        process_time = data_size * env.complexity / (env.frequency_set[action - 1] * 3600)
+        self.day_rewards[day] += 1 - (env.args.tradeoff * process_time)
+        self.total_latency[day] += process_time
+        self.reservation_status += self.reserved_energy(action, data_size)
+        self.running_instance[action - 1] += 1
+        self.n_running += 1
+        self.core_power += env.frequency_power[action - 1]
+        self.task_sequence += 1
+        heapq.heappush(self.tasks, (self.counter + process_time, self.task_sequence, action))
+
+    # advance the requests k..j-1 assuming that all of them get the preferred action (accept) or all of them are
+    # rejected. the status is kept up to the first event where the assumption or the closed form of the battery
+    # fails, the number of requests decided there is returned
+    def fast_chunk(self, k, j, accept):
+        env = self.env
+        n_arrival = j - k
+        arrival_time = self.request_time[k:j]
+        data_size = self.data_size[k:j]
+        action = self.preferred_action
+        old_finish = np.array([task[0] for task in self.tasks])
+        old_action = np.array([task[2] for task in self.tasks], dtype=int)
+        n_old = len(old_finish)
+        # energy changes before the last arrival
+        first_hour = self.energy_index
+        last_hour = min(len(self.energy_change_rate), int(np.ceil(arrival_time[-1] - self.simulation_start)))
+        energy_rate = self.energy_change_rate[first_hour:max(last_hour, first_hour)]
+        n_energy = len(energy_rate)
+        energy_time = self.simulation_start + np.arange(first_hour, first_hour + n_energy)
+        # events are the arrivals, the energy changes, the finishes of the running tasks and the finishes
+        # of the accepted requests
+        if accept:
+            process_time = data_size * env.complexity / (env.frequency_set[action - 1] * 3600)
+            new_finish = arrival_time + process_time
+            new_task = np.nonzero(new_finish < arrival_time[-1])[0]
+            power = env.frequency_power[action - 1]
+            arrival_power = np.full(n_arrival, power)
+            arrival_reserve = self.reserved_energy(action, data_size)
+        else:
+            new_finish = np.zeros(0)
+            new_task = np.zeros(0, dtype=int)
+            power = 0
+            arrival_power = np.zeros(n_arrival)
+            arrival_reserve = np.zeros(n_arrival)
+        n_new = len(new_task)
+        n_finish = n_old + n_new
+        event_time = np.concatenate([arrival_time, energy_time, old_finish, new_finish[new_task]])
+        event_power = np.concatenate([arrival_power, np.zeros(n_energy), -env.frequency_power[old_action - 1],
+                                      np.full(n_new, -power)])
+        event_running = np.concatenate([np.full(n_arrival, 1 if accept else 0), np.zeros(n_energy), -np.ones(n_finish)])
+        event_reserve = np.concatenate([arrival_reserve, np.zeros(n_energy + n_finish)])
+        event_energy = np.concatenate([np.zeros(n_arrival), np.ones(n_energy), np.zeros(n_finish)])
+        # arrivals win ties against energy changes, which win ties against task finishes
+        event_kind = np.concatenate([np.zeros(n_arrival), np.ones(n_energy), np.full(n_finish, 2)])
+        order = np.lexsort((event_kind, event_time))
+        position = np.empty(len(order), dtype=int)
+        position[order] = np.arange(len(order))
+        event_time = event_time[order]
+        elapsed = np.diff(event_time, prepend=self.counter)
+
+        # power, running tasks, production rate and reservation just before every event
+        power_before = self.core_power + np.concatenate([[0], np.cumsum(event_power[order])[:-1]])
+        running_before = self.n_running + np.concatenate([[0], np.cumsum(event_running[order])[:-1]])
+        energy_before = np.concatenate([[0], np.cumsum(event_energy[order])[:-1]]).astype(int)
+        rate_before = np.concatenate([[self.energy_produce_rate], energy_rate])[energy_before]
+        consumed = np.cumsum(power_before * elapsed)
+        reserve_before = np.maximum(
+            self.reservation_status + np.concatenate([[0], np.cumsum(event_reserve[order])[:-1]]) - consumed, 0)
+        # only the upper bound of the battery binds as long as it never runs empty
+        balance = np.cumsum(rate_before * elapsed) - consumed
+        battery_before = balance + np.minimum(self.battery_status, env.battery_size - np.maximum.accumulate(balance))
+        empty = np.nonzero(battery_before[:-1] - power_before[1:] * elapsed[1:] < 0)[0]
+        n_valid = empty[0] + 1 if len(empty) else len(event_time)
+
+        # check the assumed decision of every arrival
+        arrival_event = position[:n_arrival]
+        battery = battery_before[arrival_event]
+        reservation = reserve_before[arrival_event]
+        running = running_before[arrival_event]
+        low_power = reservation + self.reserved_energy(self.least_action, data_size) > battery
+        if accept:
+            hold = (running < env.core_number) & (reservation + self.reserved_energy(action, data_size) <= battery)
+        else:
+            hold = low_power | (running == env.core_number)
+        broken = np.nonzero(~hold)[0]
+        # the last arrival is left to be decided exactly
+        cut = min(arrival_event[broken[0]] if len(broken) else arrival_event[-1], n_valid - 1)
+        if cut == 0:
+            return 0
+
+        # record the decided requests
+        n_decided = np.searchsorted(arrival_event, cut)
+        day = self.request_day[k:k + n_decided]
+        np.add.at(self.n_total_request, day, 1)
+        if accept:
+            np.add.at(self.day_rewards, day, 1 - (env.args.tradeoff * process_time[:n_decided]))
+            np.add.at(self.total_latency, day, process_time[:n_decided])
+        else:
+            np.add.at(self.n_reject_low_power, day, low_power[:n_decided])
+            np.add.at(self.n_reject_high_latency, day, ~low_power[:n_decided])
+
+        # status at the cut, the tasks whose finish comes later keep running
+        self.counter = event_time[cut]
+        self.battery_status = battery_before[cut]
+        self.reservation_status = reserve_before[cut]
+        self.energy_produce_rate = rate_before[cut]
+        self.energy_index += energy_before[cut]
+        tasks = [task for i, task in enumerate(self.tasks) if position[n_arrival + n_energy + i] >= cut]
+        if accept:
+            finish_position = np.full(n_arrival, len(order))
+            finish_position[new_task] = position[n_arrival + n_energy + n_old:]
+            for i in np.nonzero(finish_position[:n_decided] >= cut)[0]:
+                self.task_sequence += 1
+                tasks.append((new_finish[i], self.task_sequence, action))
+        heapq.heapify(tasks)
+        self.tasks = tasks
+        self.n_running = len(tasks)
+        self.running_instance = np.zeros(len(env.frequency_set))
+        self.core_power = 0.0
+        for _, _, task_action in tasks:
+            self.running_instance[task_action - 1] += 1
+            self.core_power += env.frequency_power[task_action - 1]
+        return n_decided
+
+    def close(self):
+        self.env.close()
+
+    # simulate one episode, the per-day statistics are kept under the names used by the environment
+    def run(self, is_train, simulation_start, simulation_end, GHI_Data):
+        env = self.env
+        env.seed_episode(is_train)
+        env.simulation_start = simulation_start
+        env.simulation_end = simulation_end
+        self.simulation_start = simulation_start
+        env.gen_request()
+        self.request_time, self.data_size = env.request_time, env.request_data_size
+        self.request_day = np.ceil((self.request_time - simulation_start) / 24).astype(int) - 1
+        self.energy_change_rate = 3600 * env.panel_size * np.asarray(GHI_Data[simulation_start:simulation_end]) / 1
+        env.gen_forecast(GHI_Data, is_train)
+        self.energy_index = 0
+        self.energy_produce_rate = 0
+        self.counter = simulation_start
+        self.battery_status = 0
+        self.reservation_status = 0
+        self.running_instance = np.zeros(len(env.frequency_set))
+        self.n_running = 0
+        self.core_power = 0.0
+        # heap of (finish time, sequence, action) of the running tasks
+        self.tasks = []
+        self.task_sequence = 0
+
+        day_num = int((simulation_end - simulation_start) / 24)
+        self.total_latency = np.zeros([day_num])
+        self.n_reject_conservation = np.zeros([day_num])
+        self.n_total_request = np.zeros([day_num])
+        self.n_reject_low_power = np.zeros([day_num])
+        self.n_reject_high_latency = np.zeros([day_num])
+        self.day_rewards = np.zeros([day_num])
+
+        # the last request arrives after the end and is never decided
+        n_request = len(self.request_time) - 1
+        chunk = self.min_chunk
+        # requests are stepped exactly up to exact_until after the runs came out short, the exact stretch doubles
+        # with every further short run so that the failed attempts cost a vanishing share of the requests
+        backoff = 0
+        exact_until = 0
+        k = 0
+        while k < n_request:
+            self.advance(self.request_time[k])
+            state = self.current_status_to_state(k)
+            action = self.agent.act(state)
+            end = min(n_request, k + chunk)
+            accept = action == self.preferred_action
+            # a rejection run while every core is busy ends at the next task finish, a few arrivals later
+            if k >= exact_until and end - k > 1 and (accept or (self.n_running < env.core_number and
+                                                               not np.any(env.action_mask(state)[1:]))):
+                n_decided = self.fast_chunk(k, end, accept)
+                # grow the chunks while the assumption holds, shrink them when constraints bind
+                chunk = min(chunk * 2, self.max_chunk) if n_decided == end - k - 1 else max(chunk // 2, self.min_chunk)
+                if n_decided < self.min_chunk:
+                    # constraints bind too often for the array operations to pay off
+                    backoff = max(backoff * 2, self.min_chunk)
+                    exact_until = k + n_decided + backoff
+                else:
+                    backoff = 0
+                if n_decided > 0:
+                    k += n_decided
+                    continue
+            self.apply(k, action)
+            k += 1
+
+
+# run best_fit or worst_fit through the exact environment and through the fast-forward simulation,
+# report the wall time of both and the largest per-day deviation
+def compare_exact(args, days=300):
+    GHI_Data = read_energy_data(is_train=False, path=args.test_trace)
+    env = CompOffloadingEnv(args)
+    agent = best_fit(env) if args.method == "BF" else worst_fit(env)
+    start = time.time()
+    s = env.reset(is_train=False, simulation_start=0, simulation_end=days * 24, GHI_Data=GHI_Data)
+    done = False
+    while not done:
+        s, r, done = env.step(agent.act(s))
+    exact_time = time.time() - start
+    simulator = FastForwardSimulator(env, agent)
+    start = time.time()
+    simulator.run(is_train=False, simulation_start=0, simulation_end=days * 24, GHI_Data=GHI_Data)
+    fast_time = time.time() - start
+    print("exact {:.2f}s  fast-forward {:.2f}s".format(exact_time, fast_time))
+    for name in ['n_total_request', 'day_rewards', 'total_latency', 'n_reject_low_power', 'n_reject_high_latency']:
+        exact, fast = getattr(env, name), getattr(simulator, name)
+        relative = np.abs(fast - exact) / np.maximum(np.abs(exact), 1)
+        print("{:<24} total exact {:.6g} fast {:.6g}  max per-day relative deviation {:.2e}".format(
+            name, np.sum(exact), np.sum(fast), np.max(relative)))
+
+
+if __name__ == "__main__":
+    compare_exact(args_parser())
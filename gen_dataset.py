@@ -0,0 +1,54 @@
+import time
+
+import numpy as np
+
+from comp_offload import CompOffloadingEnv
+from schedule.best_fit import best_fit
+from schedule.worst_fit import worst_fit
+from util.data_util import read_energy_data
+from util.dataset import DatasetWriter, simulation_options
+from util.options import args_parser
+from util.seeding import AGENT_STREAM, seed_sequence
+
+
+# log the transitions of a behavior policy over the training windows of NAFA_Agent.train into args.dataset.
+# the policy takes a random valid action with probability behavior_epsilon, so the dataset also covers the
+# actions it would never choose
+def generate(args, GHI_Data=None):
+    if GHI_Data is None:
+        GHI_Data = read_energy_data(is_train=True, path=args.train_trace)
+    env = CompOffloadingEnv(args)
+    behavior = best_fit(env) if args.behavior == 'BF' else worst_fit(env)
+    rng = np.random.default_rng(seed_sequence(args, AGENT_STREAM))
+    # the simulation options are checked by train_offline, the behavior and seeds only describe the dataset
+    metadata = simulation_options(args)
+    metadata.update({'behavior': args.behavior, 'behavior_epsilon': args.behavior_epsilon, 'seed': args.seed,
+                     'trial': str(args.trial)})
+    writer = DatasetWriter(args.dataset, env.observation_space.shape[0], env.action_space.n, metadata)
+    for series in range(5):
+        for ep_num in range(10):
+            start = time.time()
+            state = env.reset(is_train=True, simulation_start=ep_num * 30 * 24, simulation_end=(ep_num + 1) * 30 * 24,
+                              GHI_Data=GHI_Data)
+            mask = env.action_mask(state)
+            done = False
+            while not done:
+                if rng.random() < args.behavior_epsilon:
+                    action = rng.choice(np.flatnonzero(mask))
+                else:
+                    action = behavior.act(state)
+                next_state, reward, done = env.step(action)
+                next_mask = env.action_mask(next_state)
+                writer.add(state, action, reward, next_state, done, mask, next_mask)
+                state, mask = next_state, next_mask
+            print('series:{} episode:{} rewards:{} transitions:{} time:{:.1f}s'.format(
+                series, ep_num, np.sum(env.day_rewards), writer.n_transitions + writer.n_staged, time.time() - start))
+    writer.close()
+    env.close()
+    return writer.n_transitions
+
+
+if __name__ == "__main__":
+    args = args_parser()
+    assert args.dataset is not None, "--dataset names the directory receiving the transitions"
+    generate(args)
@@ -0,0 +1,98 @@
+import gymnasium
+import numpy as np
+from gymnasium import spaces
+
+from comp_offload import CompOffloadingEnv
+from util.data_util import read_energy_data
+from util.options import args_parser
+from util.trace import ACCEPTED, REJECT_LOW_POWER, REJECT_CONSERVATION, REJECT_HIGH_LATENCY
+
+ENV_ID = 'NAFA/CompOffloading-v0'
+# info['reject_reason'] names the outcome of the decided request, invalid actions taken as rejections are reported
+# as INVALID_ACTION and reset, which decides no request, reports NO_DECISION
+REJECT_REASONS = {ACCEPTED: 'accepted', REJECT_LOW_POWER: 'low_power', REJECT_CONSERVATION: 'conservation',
+                  REJECT_HIGH_LATENCY: 'high_latency'}
+INVALID_ACTION = 'invalid_action'
+NO_DECISION = 'none'
+
+
+# Gymnasium API of CompOffloadingEnv for vector environments and RL libraries.
+# The options of the simulation are the command line options of main.py given as argv, the GHI trace is loaded by
+# the environment itself so that vector environments only ship picklable arguments to their workers.
+# reset(seed, options) seeds the request streams and may change is_train, simulation_start and simulation_end, step
+# returns the Gymnasium 5-tuple. The end of the simulated window truncates the episode. info carries the action mask
+# of the new state and the reject reason of the decided request; libraries without action masking may send invalid
+# actions, which invalid_action='reject' turns into rejections instead of errors
+class GymnasiumOffloadingEnv(gymnasium.Env):
+    metadata = {'render_modes': []}
+
+    def __init__(self, argv=None, is_train=False, simulation_start=0, simulation_end=300 * 24, invalid_action='reject'):
+        assert invalid_action in ['reject', 'raise']
+        self.args = args_parser(argv if argv is not None else [])
+        self.env = CompOffloadingEnv(self.args)
+        self.is_train = is_train
+        self.simulation_start = simulation_start
+        self.simulation_end = simulation_end
+        self.invalid_action = invalid_action
+        self.GHI_Data = {}
+        self.action_space = spaces.Discrete(self.env.action_space.n)
+        # the running instances of the legacy space have no upper bound, they are bounded by the capacity here
+        high = self.env.observation_space.high.copy()
+        high[3:self.env.size_index] = self.env.capacity
+        self.observation_space = spaces.Box(self.env.observation_space.low, high, dtype=np.float32)
+        self.state = None
+        self.mask = None
+        self.seeded = False
+
+    # GHI trace of training or testing, loaded once per environment
+    def trace(self, is_train):
+        if is_train not in self.GHI_Data:
+            self.GHI_Data[is_train] = read_energy_data(is_train=is_train,
+                                                       path=self.args.train_trace if is_train else self.args.test_trace)
+        return self.GHI_Data[is_train]
+
+    def info(self, reject_reason):
+        return {'action_mask': self.mask, 'reject_reason': reject_reason, 'time': self.env.counter}
+
+    def reset(self, seed=None, options=None):
+        super(GymnasiumOffloadingEnv, self).reset(seed=seed)
+        if seed is not None or not self.seeded:
+            # training episodes continue the stream of np_random, testing episodes replay the stream of the seed.
+            # without a seed np_random starts from OS entropy and the testing seed is drawn from it, so the
+            # unseeded environments of a vector environment simulate distinct requests
+            self.env.train_rng = self.np_random
+            self.env.test_seed = seed if seed is not None else int(self.np_random.integers(2 ** 32))
+            self.seeded = True
+        options = options if options is not None else {}
+        is_train = options.get('is_train', self.is_train)
+        self.state = self.env.reset(is_train=is_train,
+                                    simulation_start=options.get('simulation_start', self.simulation_start),
+                                    simulation_end=options.get('simulation_end', self.simulation_end),
+                                    GHI_Data=self.trace(is_train))
+        self.mask = self.env.action_mask(self.state)
+        return self.state.astype(np.float32), self.info(NO_DECISION)
+
+    def step(self, action):
+        action = int(action)
+        invalid = not self.mask[action]
+        if invalid and self.invalid_action == 'reject':
+            action = 0
+        self.state, reward, done = self.env.step(action)
+        self.mask = self.env.action_mask(self.state)
+        reject_reason = INVALID_ACTION if invalid else REJECT_REASONS[self.env.last_reject_reason]
+        return self.state.astype(np.float32), float(reward), False, bool(done), self.info(reject_reason)
+
+    # per-day statistics of the running episode under the names of the environment
+    def statistics(self):
+        env = self.env
+        return {'day_rewards': env.day_rewards, 'n_total_request': env.n_total_request,
+                'n_reject_low_power': env.n_reject_low_power, 'n_reject_conservation': env.n_reject_conservation,
+                'n_reject_high_latency': env.n_reject_high_latency, 'total_latency': env.total_latency}
+
+    def close(self):
+        self.env.close()
+
+
+# the id can be handed to gymnasium.make and gymnasium.make_vec (vectorization_mode 'sync' or 'async') once this
+# module is imported, the keyword arguments of the environment pass through them
+gymnasium.register(id=ENV_ID, entry_point='gym_offload:GymnasiumOffloadingEnv')
@@ -2,66 +2,77 @@ import numpy as np
 import torch
 from util.data_util import read_energy_data
 from schedule.NAFA import NAFA_Agent
+from schedule.NAFA_numpy import NAFA_NumpyPolicy
+from schedule.NAFA_table import NAFA_TablePolicy
 from schedule.best_fit import best_fit
 from comp_offload import CompOffloadingEnv
+from cluster_offload import ClusterOffloadingEnv
+from fast_forward import FastForwardSimulator
 from schedule.linUCB import LinUCBAgent
 from schedule.worst_fit import worst_fit
 from util.options import args_parser
-import pickle
+import time
+from util.results import save_run
 
 
-def save_data(env, args):
-    output = open(
-        'data/n_reject_low_power_{}_{}_{}.pkl'.format(str(args.method), str(args.lambda_r), str(args.tradeoff)), 'wb')
-    pickle.dump(env.n_reject_low_power, output)
-    output = open(
-        'data/n_reject_conservation_{}_{}_{}.pkl'.format(str(args.method), str(args.lambda_r), str(args.tradeoff)),
-        'wb')
-    pickle.dump(env.n_reject_conservation, output)
-    output = open(
-        'data/n_reject_high_latency_{}_{}_{}.pkl'.format(str(args.method), str(args.lambda_r), str(args.tradeoff)),
-        'wb')
-    pickle.dump(env.n_reject_high_latency, output)
-    output = open('data/total_latency_{}_{}_{}.pkl'.format(str(args.method), str(args.lambda_r), str(args.tradeoff)),
-                  'wb')
-    pickle.dump(env.total_latency, output)
-    output = open('data/n_total_request_{}_{}_{}.pkl'.format(str(args.method), str(args.lambda_r), str(args.tradeoff)),
-                  'wb')
-    pickle.dump(env.n_total_request, output)
-    output = open('data/day_rewards_{}_{}_{}.pkl'.format(str(args.method), str(args.lambda_r), str(args.tradeoff)),
-                  'wb')
-    pickle.dump(env.day_rewards, output)
+def save_data(env, args, wall_time):
+    # the testing request stream is drawn from test_seed in env.reset
+    metadata = {'method': str(args.method), 'lambda_r': args.lambda_r, 'tradeoff': args.tradeoff,
+                'trial': str(args.trial), 'seed': args.test_seed, 'train_seed': args.seed, 'wall_time': wall_time}
+    return save_run(env, metadata)
 
 
-if __name__ == "__main__":
-    args = args_parser()
+# train (if needed) and evaluate one configuration over the 300 testing days, return its summary
+def run(args, GHI_train=None, GHI_test=None):
+    start = time.time()
     args.device = torch.device("cpu")
-    env = CompOffloadingEnv(args)
-    N_S = env.observation_space.shape[0]
-    N_A = env.action_space.n
-    immediate_reward = 0
+    env = ClusterOffloadingEnv(args) if args.n_nodes > 1 else CompOffloadingEnv(args)
     print(args.method)
     if args.method == "NAFA":
         agent = NAFA_Agent(args, env)
         # agent.load_weights("data/model_{}_{}.pkl".format(args.lambda_r,args.tradeoff))
-        agent.train()
+        if not args.skip_train and args.dataset is not None:
+            agent.train_offline(args.dataset)
+        if not args.skip_train and not args.offline_only:
+            agent.train(GHI_train)
         # print("data/model_{}_{}_{}.pkl".format(args.lambda_r,args.tradeoff,str(args.trial)))
         agent.load_weights("data/model_{}_{}_{}.pkl".format(args.lambda_r, args.tradeoff, str(args.trial)))
+        if args.inference == "torchscript":
+            agent.compile_inference()
+        if args.inference == "numpy":
+            numpy_path = "data/model_{}_{}_{}.npz".format(args.lambda_r, args.tradeoff, str(args.trial))
+            agent.export_numpy(numpy_path)
+            agent = NAFA_NumpyPolicy(env, numpy_path)
+        if args.inference == "table":
+            agent = NAFA_TablePolicy(env, "data/table_{}_{}_{}.npz".format(args.lambda_r, args.tradeoff,
+                                                                          str(args.trial)))
     if args.method == "BF":  # best-fit
         agent = best_fit(env)
     if args.method == "WF":  # worst-fit
         agent = worst_fit(env)
     if args.method == "linUCB":
         agent = LinUCBAgent(args, env)
-        agent.train()
+        if not args.skip_train:
+            agent.train(GHI_train)
         agent.load_model()
     episode = 0
-    GHI_Data = read_energy_data(is_train=False)
+    if GHI_test is None:
+        GHI_test = read_energy_data(is_train=False, path=args.test_trace)
     done = True
     accept = 0
-    while episode < 1:
+    # the fast-forward simulation runs a single server, clusters are stepped exactly
+    fast_forward = args.fast_forward and args.method in ["BF", "WF"] and args.n_nodes == 1
+    if fast_forward:
+        # threshold policies are evaluated by the fast-forward simulation, which keeps the same statistics
+        env = FastForwardSimulator(env, agent)
+        env.run(is_train=False, simulation_start=0, simulation_end=300 * 24, GHI_Data=GHI_test)
+        accept = int(np.sum(env.n_total_request - env.n_reject_low_power - env.n_reject_conservation
+                            - env.n_reject_high_latency))
+        print("average accept ratio of {}".format(accept))
+        print("average reward{}".format(np.mean(env.day_rewards)))
+    while episode < 1 and not fast_forward:
         if done:
-            s = env.reset(is_train=False, simulation_start=0, simulation_end=300 * 24, GHI_Data=GHI_Data)
+            s = env.reset(is_train=False, simulation_start=0, simulation_end=300 * 24, GHI_Data=GHI_test)
         action = agent.act(s)
         if action != 0:
             accept += 1
@@ -70,4 +81,14 @@ if __name__ == "__main__":
             print("average accept ratio of {}".format(accept))
             print("average reward{}".format(np.mean(env.day_rewards)))
             episode += 1
-    save_data(env, args)
+    env.close()
+    save_data(env, args, time.time() - start)
+    return {'accept': accept, 'average_reward': np.mean(env.day_rewards),
+            'n_total_request': np.sum(env.n_total_request), 'n_reject_low_power': np.sum(env.n_reject_low_power),
+            'n_reject_conservation': np.sum(env.n_reject_conservation),
+            'n_reject_high_latency': np.sum(env.n_reject_high_latency), 'total_latency': np.sum(env.total_latency)}
+
+
+if __name__ == "__main__":
+    args = args_parser()
+    run(args)
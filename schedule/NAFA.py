@@ -1,30 +1,159 @@
-import random
 from copy import deepcopy
 import torch
+import torch.multiprocessing as mp
 from torch.optim import Adam
 from torch import nn
 import numpy as np
 import math
 from util.data_util import read_energy_data
+from comp_offload import CompOffloadingEnv, BatchedCompOffloadingEnv
+from util.profiling import SectionTimer, ProfileWindow
+from util.checkpoint import CheckpointWriter, read_checkpoint
+from util.dataset import TransitionDataset, simulation_options
+from util.seeding import AGENT_STREAM, ACTOR_STREAM, seed_sequence, torch_seed
 
 
-# replay memory for NAFA
+# replay memory for NAFA, a fixed-capacity ring buffer over preallocated arrays.
+# If memmap_dir is given the arrays are backed by files in that directory instead of RAM.
 class ReplayBuffer(object):
-    def __init__(self, capacity):
-        self.capacity = capacity
-        self.buffer = []
+    def __init__(self, capacity, state_dim, device, memmap_dir=None, rng=None):
+        self.capacity = int(capacity)
+        self.device = device
+        self.rng = rng if rng is not None else np.random.default_rng()
+        self.states = self.alloc('states', np.float32, (self.capacity, state_dim), memmap_dir)
+        self.next_states = self.alloc('next_states', np.float32, (self.capacity, state_dim), memmap_dir)
+        self.actions = self.alloc('actions', np.int64, (self.capacity,), memmap_dir)
+        self.rewards = self.alloc('rewards', np.float32, (self.capacity,), memmap_dir)
+        self.dones = self.alloc('dones', np.float32, (self.capacity,), memmap_dir)
+        self.position = 0
+        self.n_stored = 0
+        # importance sampling weights of the last sampled batch, uniform sampling weighs every transition alike
+        self.last_weights = None
+
+    @staticmethod
+    def alloc(name, dtype, shape, memmap_dir):
+        if memmap_dir is None:
+            return np.zeros(shape, dtype=dtype)
+        return np.lib.format.open_memmap('%s/replay_%s.npy' % (memmap_dir, name), mode='w+', dtype=dtype,
+                                         shape=shape)
 
     def add(self, s0, a, r, s1, done):
-        if len(self.buffer) >= self.capacity:
-            self.buffer.pop(0)
-        self.buffer.append((s0[None, :], a, r, s1[None, :], done))
+        index = self.position
+        self.states[index] = s0
+        self.actions[index] = a
+        self.rewards[index] = r
+        self.next_states[index] = s1
+        self.dones[index] = done
+        # overwrite the oldest transition once the buffer is full
+        self.position = (self.position + 1) % self.capacity
+        self.n_stored = min(self.n_stored + 1, self.capacity)
+        return index
 
+    def sample_index(self, batch_size):
+        return self.rng.integers(0, self.n_stored, size=batch_size)
+
+    # gather a batch of transitions by index into torch tensors
     def sample(self, batch_size):
-        s0, a, r, s1, done = zip(*random.sample(self.buffer, batch_size))
-        return np.concatenate(s0), a, r, np.concatenate(s1), done
+        index = self.sample_index(batch_size)
+        self.last_index = index
+        return (torch.from_numpy(self.states[index]).to(self.device),
+                torch.from_numpy(self.actions[index]).to(self.device),
+                torch.from_numpy(self.rewards[index]).to(self.device),
+                torch.from_numpy(self.next_states[index]).to(self.device),
+                torch.from_numpy(self.dones[index]).to(self.device))
+
+    # uniform sampling ignores the td errors
+    def update_priorities(self, td_errors):
+        return
+
+    # copies of the stored transitions and the ring position, for checkpoints
+    def snapshot(self):
+        arrays = {'replay_' + name: np.array(getattr(self, name)[:self.n_stored])
+                  for name in ('states', 'next_states', 'actions', 'rewards', 'dones')}
+        return arrays, {'position': self.position, 'n_stored': self.n_stored}
+
+    def restore(self, arrays, meta):
+        for name in ('states', 'next_states', 'actions', 'rewards', 'dones'):
+            getattr(self, name)[:meta['n_stored']] = arrays['replay_' + name]
+        self.position = meta['position']
+        self.n_stored = meta['n_stored']
 
     def size(self):
-        return len(self.buffer)
+        return self.n_stored
+
+
+# binary sum tree over the priorities, leaf i holds the priority of buffer slot i
+class SumTree(object):
+    def __init__(self, capacity):
+        self.n_leaf = 1
+        while self.n_leaf < capacity:
+            self.n_leaf *= 2
+        self.tree = np.zeros(2 * self.n_leaf)
+
+    def total(self):
+        return self.tree[1]
+
+    # set the priority of the given slots and refresh their ancestors level by level
+    def update(self, index, priority):
+        node = np.asarray(index) + self.n_leaf
+        self.tree[node] = priority
+        node = np.unique(node // 2)
+        while node[0] >= 1:
+            self.tree[node] = self.tree[2 * node] + self.tree[2 * node + 1]
+            node = np.unique(node // 2)
+
+    # find for each prefix sum value the slot whose cumulative priority range contains it
+    def find(self, value):
+        node = np.ones(len(value), dtype=np.int64)
+        value = np.array(value, dtype=float)
+        while node[0] < self.n_leaf:
+            left = 2 * node
+            go_right = value > self.tree[left]
+            value = np.where(go_right, value - self.tree[left], value)
+            node = np.where(go_right, left + 1, left)
+        return node - self.n_leaf
+
+
+# prioritized replay memory, transitions are sampled in proportion to their td error to the power of alpha
+class PrioritizedReplayBuffer(ReplayBuffer):
+    def __init__(self, capacity, state_dim, device, memmap_dir=None, rng=None, alpha=0.6, beta=0.4):
+        super(PrioritizedReplayBuffer, self).__init__(capacity, state_dim, device, memmap_dir, rng)
+        self.alpha = alpha
+        self.beta = beta
+        self.tree = SumTree(self.capacity)
+        self.max_priority = 1.0
+
+    def add(self, s0, a, r, s1, done):
+        index = super(PrioritizedReplayBuffer, self).add(s0, a, r, s1, done)
+        # new transitions get the largest priority so that they are replayed at least once
+        self.tree.update([index], self.max_priority)
+        return index
+
+    def sample_index(self, batch_size):
+        # stratified sampling, one value from each of batch_size equal segments of the total priority
+        segment = self.tree.total() / batch_size
+        value = (np.arange(batch_size) + self.rng.random(batch_size)) * segment
+        index = np.minimum(self.tree.find(value), self.n_stored - 1)
+        probability = self.tree.tree[index + self.tree.n_leaf] / self.tree.total()
+        weights = (self.n_stored * probability) ** (-self.beta)
+        self.last_weights = torch.tensor(weights / np.max(weights), dtype=torch.float).to(self.device)
+        return index
+
+    def update_priorities(self, td_errors):
+        priority = (np.abs(td_errors) + 1e-6) ** self.alpha
+        self.max_priority = max(self.max_priority, np.max(priority))
+        self.tree.update(self.last_index, priority)
+
+    def snapshot(self):
+        arrays, meta = super(PrioritizedReplayBuffer, self).snapshot()
+        arrays['replay_priority_tree'] = np.array(self.tree.tree)
+        meta['max_priority'] = self.max_priority
+        return arrays, meta
+
+    def restore(self, arrays, meta):
+        super(PrioritizedReplayBuffer, self).restore(arrays, meta)
+        self.tree.tree[:] = arrays['replay_priority_tree']
+        self.max_priority = meta['max_priority']
 
 
 # network architecture
@@ -45,28 +174,60 @@ class DQN(nn.Module):
 
 
 class NAFA_Agent:
+    # greedy actions over the valid actions of each state, the mask is applied on the Q tensor in place
     def find_max_action(self, s0, q_values):
-        actions = []
-        q_values = q_values.cpu().detach().numpy()
-        q_values = deepcopy(q_values)
-        for row in range(len(q_values)):
-            invalid = self.env.filterInvalidAction(s0[row])
-            for i in invalid:
-                q_values[row, i] = -float("inf")
-            action = np.argmax(q_values[row])
-            actions.append(action)
-        return actions
+        if torch.is_tensor(s0):
+            mask = self.action_mask(s0)
+        else:
+            mask = torch.from_numpy(self.env.action_mask(s0)).to(q_values.device)
+        return q_values.masked_fill(~mask, -float("inf")).argmax(dim=1)
 
-    def __init__(self, options, env):
+    # torch counterpart of env.action_mask for states already on the device
+    def action_mask(self, s0):
+        s0 = s0.double()
+        frequency_set = self.frequency_set
+        size_index = self.env.size_index
+        needed_reserve_energy = self.env.kappa * frequency_set ** 3 * s0[:, size_index:size_index + 1] * \
+            self.env.complexity / frequency_set
+        accept = (s0[:, 2:3] + needed_reserve_energy <= s0[:, 1:2]) & (
+                s0[:, 3:size_index].sum(dim=1, keepdim=True) != self.env.capacity)
+        return torch.cat([torch.ones_like(accept[:, :1]), accept], dim=1)
+
+    def __init__(self, options, env, sequence=None):
         self.config = options
         self.is_training = True
-        self.buffer = ReplayBuffer(self.config.max_buff)
+        # exploration and replay sampling share the generator of the agent
+        if sequence is None:
+            sequence = seed_sequence(options, AGENT_STREAM)
+        self.rng = np.random.default_rng(sequence)
+        if self.config.prioritized_replay:
+            self.buffer = PrioritizedReplayBuffer(self.config.max_buff, env.observation_space.shape[0],
+                                                  self.config.device, self.config.buffer_memmap, self.rng)
+        else:
+            self.buffer = ReplayBuffer(self.config.max_buff, env.observation_space.shape[0], self.config.device,
+                                       self.config.buffer_memmap, self.rng)
         self.action_dim = env.action_space.n
-        self.model = DQN(env.observation_space.shape[0], self.action_dim).to(self.config.device)
-        self.target_model = DQN(env.observation_space.shape[0], self.action_dim).to(self.config.device)
+        # the networks are initialized by a torch generator seeded from the agent's stream
+        with torch.random.fork_rng(devices=[]):
+            torch.manual_seed(torch_seed(sequence))
+            self.model = DQN(env.observation_space.shape[0], self.action_dim).to(self.config.device)
+            self.target_model = DQN(env.observation_space.shape[0], self.action_dim).to(self.config.device)
         self.target_model.load_state_dict(self.model.state_dict())
         self.model_optim = Adam(self.model.parameters(), lr=self.config.learning_rate)
         self.env = env
+        self.frequency_set = torch.tensor(env.frequency_set, dtype=torch.double).to(self.config.device)
+        # the state normalization of the environment, as tensors for the states already on the device
+        self.state_offset_tensor = torch.tensor(env.state_offset, dtype=torch.float).to(self.config.device)
+        self.state_scale_tensor = torch.tensor(env.state_scale, dtype=torch.float).to(self.config.device)
+        # single decisions write the normalized state into one reused buffer shared with an input tensor
+        self.input_buffer = np.zeros([1, len(env.state_offset)], dtype=np.float32)
+        self.input_tensor = torch.from_numpy(self.input_buffer)
+        # module used for greedy decisions, compile_inference swaps in a TorchScript version
+        self.inference_model = self.model
+        self.checkpoint_writer = CheckpointWriter()
+        self.timer = SectionTimer(self.config.profile)
+        self.profile_window = ProfileWindow(self.config.profiler, self.config.profile_start,
+                                            self.config.profile_frames, self.config.profile_output)
 
         # non-Linear epsilon decay
         epsilon_final = self.config.epsilon_min
@@ -78,63 +239,150 @@ class NAFA_Agent:
     # epsilon-greedy action
     def act(self, state, epsilon=None):
         if epsilon is None: epsilon = 0
-        if random.random() > epsilon or not self.is_training:
-            state_input = self.uniform_state(state.reshape(1, len(state)))
-            q_value = self.model.forward(state_input)
-            action = self.find_max_action(np.array([state]), q_value)[0]
+        if self.rng.random() > epsilon or not self.is_training:
+            action = self.greedy_action(state)
         else:
-            actions = self.env.possible_action_given_state(state)
-            action = np.random.choice(list(actions))
+            action = self.rng.choice(np.flatnonzero(self.env.action_mask(state)))
         return action
 
+    # greedy action of a single state without autograd, temporary tensors or copies
+    def greedy_action(self, state):
+        np.divide(state - self.env.state_offset, self.env.state_scale, out=self.input_buffer[0])
+        with torch.inference_mode():
+            q_value = self.inference_model(self.input_tensor.to(self.config.device)).cpu().numpy()[0]
+        q_value[~self.env.action_mask(state)] = -float("inf")
+        return int(np.argmax(q_value))
+
+    # epsilon-greedy actions for a (N, obs_dim) batch of states with one forward pass
+    def act_batch(self, states, epsilon=None):
+        if epsilon is None: epsilon = 0
+        state_input = self.uniform_state(states)
+        q_value = self.model.forward(state_input)
+        actions = self.find_max_action(states, q_value).cpu().numpy()
+        if self.is_training:
+            explore = self.rng.random(len(states)) <= epsilon
+            mask = self.env.action_mask(states)
+            for row in np.nonzero(explore)[0]:
+                actions[row] = self.rng.choice(np.flatnonzero(mask[row]))
+        return actions
+
     # back-propagation
     def learning(self, fr):
+        t = self.timer.tic()
         s0, a, r, s1, done = self.buffer.sample(self.config.batch_size)
-        r = torch.tensor(r, dtype=torch.float).to(self.config.device)
+        self.timer.toc('buffer_sample', t)
         s0_input = self.uniform_state(s0)
         s1_input = self.uniform_state(s1)
-        a = torch.tensor(a, dtype=torch.long).to(self.config.device)
-        # done = torch.tensor(done, dtype=torch.float).to(self.config.device)
+        t = self.timer.tic()
         q_values = self.model(s0_input)
         q_value = q_values.gather(1, a.unsqueeze(1)).squeeze(1)
         next_q_values = self.model(s1_input)
         max_q_action = self.find_max_action(s1, next_q_values)
-        max_q_action = torch.tensor(max_q_action).to(self.config.device)
 
         next_q_state_values = self.target_model(s1_input)
 
         next_q_value = next_q_state_values.gather(1, max_q_action.unsqueeze(1)).squeeze(1)
         expected_q_value = r + self.config.discount * next_q_value
         # Notice that we need to detach the expected_q_value
-        loss = (q_value - expected_q_value.detach()).pow(2).mean()
+        td_error = q_value - expected_q_value.detach()
+        if self.buffer.last_weights is None:
+            loss = td_error.pow(2).mean()
+        else:
+            loss = (self.buffer.last_weights * td_error.pow(2)).mean()
+        self.timer.toc('forward', t)
+        self.buffer.update_priorities(td_error.detach().cpu().numpy())
+        t = self.timer.tic()
         self.model_optim.zero_grad()
         loss.backward()
         self.model_optim.step()
+        self.timer.toc('backward', t)
 
         if fr % self.config.update_tar_interval == 0:
+            t = self.timer.tic()
             self.target_model.load_state_dict(self.model.state_dict())
+            self.timer.toc('target_sync', t)
         return loss.item()
 
+    # behavior cloning update, the masked Q values are fit as logits of the logged actions
+    def learning_bc(self):
+        s0, a, r, s1, done = self.buffer.sample(self.config.batch_size)
+        q_values = self.model(self.uniform_state(s0)).masked_fill(~self.buffer.last_masks, -float("inf"))
+        loss = nn.functional.cross_entropy(q_values, a)
+        self.model_optim.zero_grad()
+        loss.backward()
+        self.model_optim.step()
+        return loss.item()
+
+    # offline stage, learns from the transitions logged by gen_dataset.py instead of running the simulator.
+    # the dataset stands in for the replay memory during the updates, which is kept for the online stage
+    def train_offline(self, path):
+        dataset = TransitionDataset(path, self.config.device, self.rng)
+        meta = dataset.meta
+        mismatched = ['{}={} (dataset {})'.format(key, value, meta.get(key))
+                      for key, value in simulation_options(self.config).items() if meta.get(key) != value]
+        assert not mismatched, "dataset '{}' was logged with other options: {}".format(path, ', '.join(mismatched))
+        assert meta['state_dim'] == self.env.observation_space.shape[0]
+        assert dataset.size() > self.config.batch_size, "dataset '{}' holds too few transitions".format(path)
+        replay_buffer = self.buffer
+        self.buffer = dataset
+        losses = []
+        for fr in range(1, self.config.offline_updates + 1):
+            if self.config.offline_loss == 'bc':
+                losses.append(self.learning_bc())
+            else:
+                losses.append(self.learning(fr))
+            if fr % self.config.print_interval == 0:
+                print("offline updates: %8d, passes: %4d, losses: %4f" % (fr, dataset.passes,
+                                                                          np.sum(losses[-100:]) / 100))
+                self.print_timing('interval')
+        self.buffer = replay_buffer
+        # the online stage starts from the offline network on both sides of the double DQN target
+        self.target_model.load_state_dict(self.model.state_dict())
+        self.save_model("data", str(self.config.lambda_r) + "_" + str(self.config.tradeoff) + "_" + str(
+            self.config.trial))
+        return losses
+
     # NAFA's training stage
-    def train(self):
+    def train(self, GHI_Data=None):
+        # checkpoints record the progress of the serial training only
+        assert not self.config.resume or (self.config.n_actors == 0 and self.config.n_envs == 1), \
+            "--resume continues the serial training, it can not be combined with --n_actors or --n_envs"
+        if self.config.n_actors > 0:
+            return self.train_actor_learner(GHI_Data)
+        if self.config.n_envs > 1:
+            return self.train_batched(GHI_Data)
         losses = []
         all_rewards = []
         counters = []
         fr = 0
         episode_reward = 0
-        GHI_Data = read_energy_data(is_train=True)
-        for series in range(5):
+        if GHI_Data is None:
+            GHI_Data = read_energy_data(is_train=True, path=self.config.train_trace)
+        start_series, start_ep_num = 0, 0
+        if self.config.resume:
+            progress = self.load_checkpoint()
+            if progress is not None:
+                fr, start_series, start_ep_num = progress['fr'], progress['series'], progress['ep_num']
+                print('resume from series:{} episode:{} frame:{}'.format(start_series, start_ep_num, fr))
+        for series in range(start_series, 5):
             done = True
-            ep_num = 0
+            ep_num = start_ep_num if series == start_series else 0
             while ep_num < 10:
                 if done:
                     state = self.env.reset(is_train=True, simulation_start=ep_num * 30 * 24,
                                            simulation_end=(ep_num + 1) * 30 * 24, GHI_Data=GHI_Data)
                 fr += 1
+                self.profile_window.on_frame(fr)
                 epsilon = self.epsilon_by_frame(fr)
+                t = self.timer.tic()
                 action = self.act(state, epsilon)
+                self.timer.toc('act', t)
+                t = self.timer.tic()
                 next_state, reward, done = self.env.step(action)
+                self.timer.toc('env_step', t)
+                t = self.timer.tic()
                 self.buffer.add(state, action, reward, next_state, done)
+                self.timer.toc('buffer_add', t)
                 episode_reward += reward
                 all_rewards.append(reward)
                 counters.append(self.env.counter)
@@ -149,35 +397,166 @@ class NAFA_Agent:
                         self.env.counter / 24, episode_reward / ((self.env.counter - self.env.simulation_start) / 24),
                         np.sum(losses[-100:]) / 100, ep_num))
                     print("epsilon{}".format(epsilon))
+                    self.print_timing('interval')
                 state = next_state
                 if done:
                     print('episode:{} rewards:{}  epsilon{} losses:{}'.format(ep_num, episode_reward, epsilon,
                                                                               np.sum(losses[-100:]) / 100))
+                    self.print_timing('episode')
                     self.save_model("data", str(self.config.lambda_r) + "_" + str(self.config.tradeoff) + "_" + str(
                         self.config.trial))
                     episode_reward = 0
                     ep_num += 1
+                    self.save_checkpoint({'fr': fr, 'series': series, 'ep_num': ep_num})
 
             # self.save_data(all_rewards,counters,loss)
+        self.checkpoint_writer.wait()
+
+    # NAFA's training stage on n_envs replicas stepped in lockstep, every frame adds one transition per replica
+    def train_batched(self, GHI_Data=None):
+        losses = []
+        fr = 0
+        if GHI_Data is None:
+            GHI_Data = read_energy_data(is_train=True, path=self.config.train_trace)
+        env = BatchedCompOffloadingEnv(self.config, self.config.n_envs)
+        for series in range(5):
+            for ep_num in range(10):
+                states = env.reset(is_train=True, simulation_start=ep_num * 30 * 24,
+                                   simulation_end=(ep_num + 1) * 30 * 24, GHI_Data=GHI_Data)
+                done = np.zeros(env.n_envs, dtype=bool)
+                episode_reward = np.zeros(env.n_envs)
+                while not np.all(done):
+                    fr += 1
+                    self.profile_window.on_frame(fr)
+                    epsilon = self.epsilon_by_frame(fr)
+                    active = ~done
+                    t = self.timer.tic()
+                    actions = self.act_batch(states, epsilon)
+                    self.timer.toc('act', t)
+                    t = self.timer.tic()
+                    next_states, rewards, done = env.step(actions)
+                    self.timer.toc('env_step', t)
+                    t = self.timer.tic()
+                    for row in np.nonzero(active)[0]:
+                        self.buffer.add(states[row], actions[row], rewards[row], next_states[row], done[row])
+                    self.timer.toc('buffer_add', t)
+                    episode_reward += rewards
+                    if self.buffer.size() > self.config.batch_size:
+                        loss = self.learning(fr)
+                        losses.append(loss)
+                    else:
+                        losses.append(0)
+
+                    if fr % self.config.print_interval == 0:
+                        print("day: %5d, rewards: %4f losses: %4f episode: %4d  " % (
+                            np.min(env.counter) / 24,
+                            np.mean(episode_reward / ((env.counter - env.simulation_start) / 24)),
+                            np.sum(losses[-100:]) / 100, ep_num))
+                        print("epsilon{}".format(epsilon))
+                        self.print_timing('interval')
+                    states = next_states
+                print('episode:{} rewards:{}  epsilon{} losses:{}'.format(ep_num, np.mean(episode_reward), epsilon,
+                                                                          np.sum(losses[-100:]) / 100))
+                self.print_timing('episode')
+                self.save_model("data", str(self.config.lambda_r) + "_" + str(self.config.tradeoff) + "_" + str(
+                    self.config.trial))
+
+    # NAFA's training stage with n_actors simulator processes feeding transitions to this learner process.
+    # The 5 series x 10 monthly windows are dealt round-robin to the actors, which act with a copy of the policy
+    # refreshed from shared memory, while the learner trains on the replay memory at the update rate of the serial mode
+    def train_actor_learner(self, GHI_Data=None):
+        if GHI_Data is None:
+            GHI_Data = read_energy_data(is_train=True, path=self.config.train_trace)
+        context = mp.get_context('spawn')
+        shared_model = DQN(self.env.observation_space.shape[0], self.action_dim)
+        shared_model.load_state_dict(self.model.state_dict())
+        shared_model.share_memory()
+        weight_version = context.Value('i', 0)
+        weight_lock = context.Lock()
+        # transitions travel through shared-memory slots of actor_chunk transitions and the queues only carry slot
+        # indices: an actor takes a free slot, fills it in place and sends its index, the learner copies the slot
+        # into the replay memory and frees it. Waiting for a free slot bounds how far the actors run ahead
+        n_slots = 4 * self.config.n_actors
+        slots = transition_slots(n_slots, self.config.actor_chunk, self.env.observation_space.shape[0])
+        slot_arrays = [slot.numpy() for slot in slots]
+        free_slots = context.Queue()
+        for slot in range(n_slots):
+            free_slots.put(slot)
+        transition_queue = context.Queue()
+        windows = [ep_num for series in range(5) for ep_num in range(10)]
+        actors = []
+        for actor_id in range(self.config.n_actors):
+            actor = context.Process(target=run_actor, args=(
+                actor_id, self.config, GHI_Data, windows[actor_id::self.config.n_actors], shared_model,
+                weight_version, weight_lock, slots, free_slots, transition_queue))
+            actor.start()
+            actors.append(actor)
+
+        losses = []
+        fr = 0
+        finished = 0
+        n_transitions = 0
+        # one update per transition once the replay memory exceeds a batch, as in the serial mode. The learner only
+        # takes the next message once its updates have caught up with the transitions it consumed, the actors wait
+        # for free slots meanwhile, and it keeps learning after the actors finished until the updates are complete
+        while finished < len(actors) or fr < n_transitions - self.config.batch_size:
+            if fr >= n_transitions - self.config.batch_size:
+                kind, payload = transition_queue.get()
+                if kind == 'transitions':
+                    slot, n = payload
+                    for transition in zip(*[array[slot, :n] for array in slot_arrays]):
+                        self.buffer.add(*transition)
+                    free_slots.put(slot)
+                    n_transitions += n
+                elif kind == 'episode':
+                    actor_id, ep_num, episode_reward = payload
+                    print('actor:{} episode:{} rewards:{} losses:{}'.format(actor_id, ep_num, episode_reward,
+                                                                            np.sum(losses[-100:]) / 100))
+                    self.print_timing('episode')
+                    self.save_model("data", str(self.config.lambda_r) + "_" + str(self.config.tradeoff) + "_" + str(
+                        self.config.trial))
+                else:
+                    finished += 1
+                continue
+            fr += 1
+            self.profile_window.on_frame(fr)
+            losses.append(self.learning(fr))
+            if fr % self.config.weight_sync_interval == 0:
+                with weight_lock:
+                    shared_model.load_state_dict(self.model.state_dict())
+                    weight_version.value += 1
+            if fr % self.config.print_interval == 0:
+                print("updates: %8d, buffer: %8d, losses: %4f" % (fr, self.buffer.size(), np.sum(losses[-100:]) / 100))
+                self.print_timing('interval')
+        for actor in actors:
+            actor.join()
+        self.save_model("data", str(self.config.lambda_r) + "_" + str(self.config.tradeoff) + "_" + str(
+            self.config.trial))
+
+    # print the section timing of the last print interval or episode. uniform_state is also counted in the section
+    # calling it, act of the batched training, single decisions normalize in greedy_action without it
+    def print_timing(self, scope):
+        report = self.timer.report(scope)
+        if report:
+            print(report)
 
     # debug usage . check the input state.
     def check_input_state(self, input_s):
-        if np.max(input_s) > 1 or np.min(input_s) < 0:
+        if input_s.max() > 1 or input_s.min() < 0:
             return False
         else:
             return True
 
     # uniform the state to the scale of [0,1]
     def uniform_state(self, s):
-        input_s = deepcopy(s)
-        input_s[:, 0] = (input_s[:, 0] - 0) / (24 - 0)
-        input_s[:, 1] = (input_s[:, 1] - 0) / (self.env.battery_size - 0)
-        input_s[:, 2] = (input_s[:, 2] - 0) / (self.env.battery_size - 0)
-        input_s[:, 3:-1] = (input_s[:, 3:-1] - 0) / (self.env.core_number - 0)
-        input_s[:, -1] = (input_s[:, -1] - (self.env.avg_data_size - 10 * 8 * 1e6)) / (
-                (self.env.avg_data_size + 10 * 8 * 1e6) - (self.env.avg_data_size - 10 * 8 * 1e6))
+        t = self.timer.tic()
+        if torch.is_tensor(s):
+            input_s = (s - self.state_offset_tensor) / self.state_scale_tensor
+        else:
+            input_s = (s - self.env.state_offset) / self.env.state_scale
         assert self.check_input_state(input_s)
-        input_s = torch.tensor(input_s, dtype=torch.float).to(self.config.device)
+        input_s = torch.as_tensor(input_s, dtype=torch.float).to(self.config.device)
+        self.timer.toc('uniform_state', t)
         return input_s
 
     # load weight for the Q network
@@ -195,3 +574,103 @@ class NAFA_Agent:
 
     def save_model(self, output, tag=''):
         torch.save(self.model.state_dict(), '%s/model_%s.pkl' % (output, tag))
+
+    def checkpoint_path(self):
+        return 'data/checkpoint_{}_{}_{}'.format(self.config.lambda_r, self.config.tradeoff, self.config.trial)
+
+    # snapshot everything needed to continue training from the given progress and write it in the background
+    def save_checkpoint(self, progress):
+        buffer_arrays, buffer_meta = self.buffer.snapshot()
+        state = {'model': deepcopy(self.model.state_dict()), 'target_model': deepcopy(self.target_model.state_dict()),
+                 'optimizer': deepcopy(self.model_optim.state_dict()), 'progress': progress, 'buffer': buffer_meta,
+                 'agent_rng': self.rng.bit_generator.state, 'env_rng': self.env.train_rng.bit_generator.state}
+        self.checkpoint_writer.write(self.checkpoint_path(), state, buffer_arrays)
+
+    # restore the latest checkpoint and return its progress, None if there is no checkpoint
+    def load_checkpoint(self):
+        state, arrays = read_checkpoint(self.checkpoint_path())
+        if state is None:
+            return None
+        self.model.load_state_dict(state['model'])
+        self.target_model.load_state_dict(state['target_model'])
+        self.model_optim.load_state_dict(state['optimizer'])
+        prioritized = 'replay_priority_tree' in arrays
+        assert prioritized == self.config.prioritized_replay, \
+            "checkpoint '{}' holds a {} replay memory, resume it with{} --prioritized_replay".format(
+                self.checkpoint_path(), 'prioritized' if prioritized else 'uniform', '' if prioritized else 'out')
+        self.buffer.restore(arrays, state['buffer'])
+        self.rng.bit_generator.state = state['agent_rng']
+        self.env.train_rng.bit_generator.state = state['env_rng']
+        return state['progress']
+
+    # use a frozen TorchScript copy of the current Q network for greedy decisions
+    def compile_inference(self):
+        example = torch.zeros([1, len(self.env.state_offset)]).to(self.config.device)
+        self.inference_model = torch.jit.optimize_for_inference(torch.jit.trace(deepcopy(self.model).eval(), example))
+
+    # export the Q network and the state normalization as plain arrays for schedule.NAFA_numpy
+    def export_numpy(self, path):
+        layers = [layer for layer in self.model.nn if isinstance(layer, nn.Linear)]
+        weights = {}
+        for i, layer in enumerate(layers):
+            weights['weight%d' % i] = layer.weight.detach().cpu().numpy()
+            weights['bias%d' % i] = layer.bias.detach().cpu().numpy()
+        np.savez(path, state_offset=self.env.state_offset, state_scale=self.env.state_scale, **weights)
+
+
+# shared-memory slots of the actor-learner mode in the order of ReplayBuffer.add: states, actions, rewards,
+# next states and dones of chunk transitions per slot
+def transition_slots(n_slots, chunk, state_dim):
+    slots = [torch.zeros([n_slots, chunk, state_dim]), torch.zeros([n_slots, chunk], dtype=torch.int64),
+             torch.zeros([n_slots, chunk]), torch.zeros([n_slots, chunk, state_dim]), torch.zeros([n_slots, chunk])]
+    return [slot.share_memory_() for slot in slots]
+
+
+# simulator worker of the actor-learner mode, runs its monthly windows of the GHI trace and writes its transitions
+# into the shared slots one chunk at a time
+def run_actor(actor_id, config, GHI_Data, windows, shared_model, weight_version, weight_lock, slots, free_slots,
+              transition_queue):
+    torch.set_num_threads(1)
+    # the actor only acts, it must not share the learner's files or profile
+    config.profile = False
+    config.profiler = None
+    config.trace_path = None
+    config.buffer_memmap = None
+    config.prioritized_replay = False
+    config.max_buff = 1
+    # every actor simulates and explores with its own streams
+    env_sequence, agent_sequence = seed_sequence(config, ACTOR_STREAM + actor_id).spawn(2)
+    env = CompOffloadingEnv(config, env_sequence)
+    agent = NAFA_Agent(config, env, agent_sequence)
+    slot_arrays = [slot.numpy() for slot in slots]
+    local_version = -1
+    fr = 0
+    slot = None
+    n = 0
+    for ep_num in windows:
+        state = env.reset(is_train=True, simulation_start=ep_num * 30 * 24, simulation_end=(ep_num + 1) * 30 * 24,
+                          GHI_Data=GHI_Data)
+        episode_reward = 0
+        done = False
+        while not done:
+            # pull fresh policy weights once the learner has published a new version
+            if fr % config.weight_sync_interval == 0 and weight_version.value != local_version:
+                with weight_lock:
+                    agent.model.load_state_dict(shared_model.state_dict())
+                    local_version = weight_version.value
+            fr += 1
+            action = agent.act(state, agent.epsilon_by_frame(fr))
+            next_state, reward, done = env.step(action)
+            if slot is None:
+                slot = free_slots.get()
+                n = 0
+            for array, value in zip(slot_arrays, (state, action, reward, next_state, done)):
+                array[slot, n] = value
+            n += 1
+            episode_reward += reward
+            state = next_state
+            if n == config.actor_chunk or done:
+                transition_queue.put(('transitions', (slot, n)))
+                slot = None
+        transition_queue.put(('episode', (actor_id, ep_num, episode_reward)))
+    transition_queue.put(('done', actor_id))
@@ -0,0 +1,33 @@
+import numpy as np
+
+
+# torch-free NAFA policy, runs the Q network exported by NAFA_Agent.export_numpy with plain matrix products
+class NAFA_NumpyPolicy():
+    def __init__(self, env, path):
+        self.env = env
+        with np.load(path) as data:
+            self.state_offset = data['state_offset']
+            self.state_scale = data['state_scale']
+            n_layer = len([name for name in data.files if name.startswith('weight')])
+            # weights are stored as (out, in) like torch, keep them transposed for row-vector products
+            self.layers = [(np.ascontiguousarray(data['weight%d' % i].T, dtype=float), data['bias%d' % i].astype(float))
+                           for i in range(n_layer)]
+
+    # Q values of one state (d,) or a batch of states (B, d)
+    def q_values(self, states):
+        x = (states - self.state_offset) / self.state_scale
+        for i, (weight, bias) in enumerate(self.layers):
+            x = x.dot(weight) + bias
+            if i < len(self.layers) - 1:
+                np.maximum(x, 0, out=x)
+        return x
+
+    def act(self, s):
+        q_value = self.q_values(s)
+        q_value[~self.env.action_mask(s)] = -float("inf")
+        return int(np.argmax(q_value))
+
+    def act_many(self, states):
+        q_value = self.q_values(states)
+        q_value[~self.env.action_mask(states)] = -float("inf")
+        return np.argmax(q_value, axis=1)
@@ -0,0 +1,57 @@
+import numpy as np
+
+
+# features the table is indexed by: hour, battery, reservation, total running instances and data size.
+# the running instances only count the busy cores, whatever their frequencies, forecast features are left out
+def table_features(states, size_index):
+    states = np.asarray(states, dtype=float)
+    return np.stack([states[:, 0], states[:, 1], states[:, 2], np.sum(states[:, 3:size_index], axis=1),
+                     states[:, size_index]], axis=1)
+
+
+# NAFA policy distilled by distill.py into a quantized lookup table, needs neither torch nor the Q network.
+# every cell of the feature grid holds the actions ranked by the averaged Q values of the network, a decision
+# takes the best ranked action that is valid in the state
+class NAFA_TablePolicy():
+    def __init__(self, env, path):
+        self.env = env
+        self.size_index = env.size_index
+        with np.load(path) as data:
+            self.table = data['table']
+            self.bins = data['bins'].astype(int)
+            self.lows = data['lows'].astype(float)
+            self.highs = data['highs'].astype(float)
+        self.scales = self.bins / (self.highs - self.lows)
+        # per-feature constants as python values, a single decision avoids small array operations
+        self.bin_list = self.bins.tolist()
+        self.low_list = self.lows.tolist()
+        self.scale_list = self.scales.tolist()
+
+    # flat cell index of a batch of states
+    def cells(self, states):
+        index = np.floor((table_features(states, self.size_index) - self.lows) * self.scales).astype(int)
+        index = np.clip(index, 0, self.bins - 1)
+        return np.ravel_multi_index(index.T, self.bins)
+
+    # flat cell index of one state
+    def cell(self, s):
+        state = s.tolist()
+        size_index = self.size_index
+        features = (state[0], state[1], state[2], sum(state[3:size_index]), state[size_index])
+        cell = 0
+        for feature, low, scale, n_bin in zip(features, self.low_list, self.scale_list, self.bin_list):
+            cell = cell * n_bin + min(max(int((feature - low) * scale), 0), n_bin - 1)
+        return cell
+
+    def act(self, s):
+        mask = self.env.action_mask(s)
+        for action in self.table[self.cell(s)]:
+            if mask[action]:
+                return int(action)
+        return 0
+
+    def act_many(self, states):
+        ranking = self.table[self.cells(states)]
+        rows = np.arange(len(ranking))[:, None]
+        valid = self.env.action_mask(states)[rows, ranking]
+        return ranking[rows[:, 0], np.argmax(valid, axis=1)]
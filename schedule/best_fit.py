@@ -1,17 +1,18 @@
+import numpy as np
+
+
 # best fit algorithm, which consistently choose the least frequency if applicable.
 class best_fit():
     def __init__(self, env):
         self.env = env
         self.last_deploy_core = 0
+        # action taken whenever it is feasible
+        self.preferred_action = 1
 
     def act(self, s):
-        possible_actions = self.env.possible_action_given_state(s)
-        accept = False
-        for frequency_index in range(len(self.env.frequency_set)):
-            action = frequency_index + 1
-            if action in possible_actions:
-                accept = True
-                break
-        if not accept:
-            action = 0
+        possible_actions = self.env.action_mask(s)[1:]
+        if not np.any(possible_actions):
+            return 0
+        # actions are ordered by increasing frequency, take the first valid one
+        action = np.argmax(possible_actions) + 1
         return action
@@ -0,0 +1,62 @@
+import numpy as np
+
+
+# dispatch policies of the cluster environment, each one picks the node serving the arriving request
+# from the per-node status arrays of the environment. reads_status tells the environment to bring the status of
+# every node up to the arrival time before the selection
+
+
+# hand the requests to the nodes in turn
+class round_robin():
+    reads_status = False
+
+    def __init__(self, env):
+        self.env = env
+        self.next_node = 0
+
+    def reset(self):
+        self.next_node = 0
+
+    def select(self, data_size):
+        node = self.next_node
+        self.next_node = (self.next_node + 1) % self.env.n_nodes
+        return node
+
+
+# hand the request to the node running the fewest tasks, the task counts are always up to date
+class least_loaded():
+    reads_status = False
+
+    def __init__(self, env):
+        self.env = env
+
+    def reset(self):
+        pass
+
+    def select(self, data_size):
+        return int(np.argmin(self.env.n_running))
+
+
+# hand the request to the node left with the most unreserved energy after running it at the least frequency,
+# nodes with a free core come first
+class energy_aware():
+    reads_status = True
+
+    def __init__(self, env):
+        self.env = env
+        least = np.argmin(env.frequency_set)
+        self.least_energy_factor = env.frequency_power_factor[least] * env.complexity / env.frequency_set[least]
+
+    def reset(self):
+        pass
+
+    def select(self, data_size):
+        env = self.env
+        spare_energy = env.battery_status - env.reservation_status - self.least_energy_factor * data_size
+        free = env.n_running < env.core_number
+        if np.any(free):
+            spare_energy = np.where(free, spare_energy, -np.inf)
+        return int(np.argmax(spare_energy))
+
+
+DISPATCH_POLICIES = {'round_robin': round_robin, 'least_loaded': least_loaded, 'energy_aware': energy_aware}
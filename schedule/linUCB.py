@@ -1,7 +1,5 @@
 import pickle
-from copy import deepcopy
 import numpy as np
-import math
 
 from util.data_util import read_energy_data
 
@@ -13,56 +11,45 @@ class LinUCBAgent:
         self.env = env
         self.K = env.action_space.n
         self.ridge_regression_para = 1
-        self.matrix_H = []
-        self.b = []
         self.exploration_factor = 10
         self.d = env.observation_space.shape[0]
-        for arm in range(self.K):
-            self.matrix_H.append(self.ridge_regression_para * np.eye(self.d))
-            self.b.append(np.zeros([self.d, 1]))
+        # per-arm statistics stacked along the first axis: H (K, d, d), its inverse, b (K, d) and theta = H^-1 b
+        self.matrix_H = self.ridge_regression_para * np.tile(np.eye(self.d), (self.K, 1, 1))
+        self.matrix_H_inv = np.tile(np.eye(self.d), (self.K, 1, 1)) / self.ridge_regression_para
+        self.b = np.zeros([self.K, self.d])
+        self.theta = np.zeros([self.K, self.d])
 
+    # uniform one state (d,) or a batch of states (B, d) to the scale of [0,1] with the normalization of the env
     def uniform_state(self, s):
-        input_s = deepcopy(s)
-        input_s[0] = (input_s[0] - 0) / (24 - 0)
-        input_s[1] = (input_s[1] - 0) / (self.env.battery_size - 0)
-        input_s[2] = (input_s[2] - 0) / (self.env.battery_size - 0)
-        input_s[3:-1] = (input_s[3:-1] - 0) / (self.env.core_number - 0)
-        input_s[-1] = (input_s[-1] - (self.env.avg_data_size - 10 * 8 * 1e6)) / (
-                (self.env.avg_data_size + 10 * 8 * 1e6) - (self.env.avg_data_size - 10 * 8 * 1e6))
-        input_s = np.resize(input_s, (self.d, 1))
-        return input_s
+        return (np.asarray(s, dtype=float) - self.env.state_offset) / self.env.state_scale
+
+    # upper confidence bound of every arm for a batch of contexts (B, d), the result has shape (B, K)
+    def estimate_reward(self, context):
+        empirical_reward = context.dot(self.theta.T)
+        exploration_reward = self.exploration_factor * np.sqrt(
+            np.einsum('bi,kij,bj->bk', context, self.matrix_H_inv, context))
+        return empirical_reward + exploration_reward
 
     def act(self, s0):
         # transfer the selection client into context
         context = self.uniform_state(s0)
-        empirical_reward = np.zeros(self.K)
-        exploration_reward = np.zeros(self.K)
-        estimated_reward = np.zeros(self.K)
-        coefficient = [[] for i in range(self.K)]
-        for arm in range(self.K):
-            coefficient[arm] = np.linalg.inv(self.matrix_H[arm]).dot(self.b[arm])
-
-            empirical_reward[arm] = context.transpose().dot(coefficient[arm])
-            exploration_reward[arm] = self.exploration_factor * math.sqrt(
-                context.transpose().dot(np.linalg.inv(self.matrix_H[arm])).dot(context))
-            # print(exploration_reward[arm])
-            estimated_reward[arm] = empirical_reward[arm] + exploration_reward[arm]
-            # print(select_arm)
-        # print("empirical:{}".format(empirical_reward))
-        # print("exploration:{}".format(exploration_reward))
-        # print("estimated:{}".format(estimated_reward))
-        # print(coefficient)
+        estimated_reward = self.estimate_reward(context[None, :])[0]
         # select the arm with highest index if its estimated_reward is the biggest
-        invalid = self.env.filterInvalidAction(s0)
-        for i in invalid:
-            estimated_reward[i] = -float("inf")
+        estimated_reward[~self.env.action_mask(s0)] = -float("inf")
         optimal_arm = np.argmax(estimated_reward)
         return optimal_arm
 
-    def train(self):
+    # select arms for a batch of states (B, d) at once, used for offline evaluation
+    def act_many(self, states):
+        estimated_reward = self.estimate_reward(self.uniform_state(states))
+        estimated_reward[~self.env.action_mask(states)] = -float("inf")
+        return np.argmax(estimated_reward, axis=1)
+
+    def train(self, GHI_Data=None):
 
         episode_reward = 0
-        GHI_Data = read_energy_data(is_train=True)
+        if GHI_Data is None:
+            GHI_Data = read_energy_data(is_train=True, path=self.config.train_trace)
         fr = 0
 
         for series in range(5):
@@ -87,23 +74,35 @@ class LinUCBAgent:
                     episode_reward = 0
                     ep_num += 1
 
+    # one model file per trial so that trials of the same configuration can run in parallel
+    def model_path(self):
+        return 'data/linucb_{}_{}_{}.pkl'.format(str(self.config.lambda_r), str(self.config.tradeoff),
+                                                 str(self.config.trial))
+
     def save_model(self):
         data = [self.matrix_H, self.b]
-        output = open('data/linucb_{}_{}.pkl'.format(str(self.config.lambda_r), str(self.config.tradeoff)), 'wb')
-        pickle.dump(data, output)
+        with open(self.model_path(), 'wb') as output:
+            pickle.dump(data, output)
 
     def load_model(self):
-        output = open('data/linucb_{}_{}.pkl'.format(str(self.config.lambda_r), str(self.config.tradeoff)), 'rb')
-        print('data/linucb_{}_{}.pkl'.format(str(self.config.lambda_r), str(self.config.tradeoff)))
-        data = pickle.load(output)
-        self.matrix_H = data[0]
-        self.b = data[1]
+        print(self.model_path())
+        with open(self.model_path(), 'rb') as output:
+            data = pickle.load(output)
+        # models saved before the stacked layout hold lists of (d, d) and (d, 1) arrays
+        self.matrix_H = np.asarray(data[0], dtype=float).reshape(self.K, self.d, self.d)
+        self.b = np.asarray(data[1], dtype=float).reshape(self.K, self.d)
+        self.matrix_H_inv = np.linalg.inv(self.matrix_H)
+        self.theta = np.einsum('kij,kj->ki', self.matrix_H_inv, self.b)
 
     def do_update(self, arm, state, reward):
         # transfer the selection client into context
         context = self.uniform_state(state)
-        self.matrix_H[arm] = self.matrix_H[arm] + context.dot(context.transpose())
-        self.b[arm] = self.b[arm] + context * (reward)
+        self.matrix_H[arm] += np.outer(context, context)
+        self.b[arm] += context * reward
+        # Sherman-Morrison rank-one update of the inverse, no matrix inversion needed
+        H_inv_context = self.matrix_H_inv[arm].dot(context)
+        self.matrix_H_inv[arm] -= np.outer(H_inv_context, H_inv_context) / (1 + context.dot(H_inv_context))
+        self.theta[arm] = self.matrix_H_inv[arm].dot(self.b[arm])
 
     # function for testing purpose
     def gen_fake_reward(self, state, action):
@@ -1,17 +1,17 @@
+import numpy as np
+
+
 # worst fit algorithm, which consistently choose the largest frequency if applicable.
 class worst_fit():
     def __init__(self,env):
         self.env=env
         self.last_deploy_core=0
+        # action taken whenever it is feasible
+        self.preferred_action = len(env.frequency_set)
     def act(self,s):
-        possible_actions = self.env.possible_action_given_state(s)
-        accept=False
-        for frequency_index in range(len(self.env.frequency_set) - 1, -1, -1):
-            action= frequency_index+1
-            if action in possible_actions:
-                accept = True
-                break
-        if not accept:
-            action=0
+        possible_actions = self.env.action_mask(s)[1:]
+        if not np.any(possible_actions):
+            return 0
+        # actions are ordered by increasing frequency, take the last valid one
+        action = len(possible_actions) - np.argmax(possible_actions[::-1])
         return action
-
@@ -0,0 +1,104 @@
+import csv
+import itertools
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import torch
+
+from main import run
+from util.data_util import read_energy_data
+from util.options import args_parser, sweep_args_parser
+
+KEYS = ['method', 'lambda_r', 'tradeoff', 'trial']
+# the results table holds the options of every configuration followed by its results
+RESULTS = ['accept', 'average_reward', 'n_total_request', 'n_reject_low_power', 'n_reject_conservation',
+           'n_reject_high_latency', 'total_latency', 'wall_time']
+
+# GHI traces parsed once by the parent and handed to every worker at start up
+worker_GHI = {}
+
+
+def load_spec(path):
+    with open(path, 'r') as f:
+        if path.endswith(('.yaml', '.yml')):
+            import yaml
+            return yaml.safe_load(f)
+        return json.load(f)
+
+
+# expand the grid into one option dict per configuration, scalar spec entries apply to every configuration.
+# The configurations hold KEYS and every option of the spec, in this order
+def expand_grid(sweep_args):
+    grid = {key: getattr(sweep_args, key) for key in KEYS}
+    if sweep_args.spec is not None:
+        grid.update(load_spec(sweep_args.spec))
+    axes = [key for key in grid if isinstance(grid[key], list)]
+    fixed = {key: value for key, value in grid.items() if key not in axes}
+    configs = []
+    for values in itertools.product(*[grid[key] for key in axes]):
+        point = dict(zip(axes, values))
+        configs.append({key: point[key] if key in point else fixed[key] for key in grid})
+    return configs
+
+
+def config_key(config, keys):
+    return tuple(str(config[key]) for key in keys)
+
+
+# keys of the configurations already in the results table, which must have been written by a sweep over the same
+# options
+def finished_configs(output, keys):
+    if not os.path.exists(output):
+        return set()
+    with open(output, 'r') as f:
+        reader = csv.DictReader(f)
+        assert reader.fieldnames == keys + RESULTS, \
+            "'{}' holds a sweep over the options {}, not {}".format(output, reader.fieldnames[:-len(RESULTS)], keys)
+        return set(tuple(row[key] for key in keys) for row in reader)
+
+
+def init_worker(GHI_train, GHI_test, threads):
+    torch.set_num_threads(threads)
+    worker_GHI['train'] = GHI_train
+    worker_GHI['test'] = GHI_test
+
+
+def run_config(config):
+    args = args_parser([])
+    for key, value in config.items():
+        setattr(args, key, value)
+    start = time.time()
+    # configurations with their own traces load them in the worker, the loader caches them
+    GHI_train = worker_GHI['train'] if 'train_trace' not in config else None
+    GHI_test = worker_GHI['test'] if 'test_trace' not in config else None
+    result = run(args, GHI_train, GHI_test)
+    result.update(config)
+    result['wall_time'] = time.time() - start
+    return result
+
+
+if __name__ == "__main__":
+    sweep_args = sweep_args_parser()
+    configs = expand_grid(sweep_args)
+    keys = list(configs[0])
+    done = finished_configs(sweep_args.output, keys)
+    configs = [config for config in configs if config_key(config, keys) not in done]
+    print("{} configurations to run, {} already finished".format(len(configs), len(done)))
+    GHI_train = read_energy_data(is_train=True)
+    GHI_test = read_energy_data(is_train=False)
+    new_table = not os.path.exists(sweep_args.output)
+    with open(sweep_args.output, 'a', newline='') as f, ProcessPoolExecutor(
+            max_workers=sweep_args.workers, initializer=init_worker,
+            initargs=(GHI_train, GHI_test, sweep_args.threads)) as executor:
+        writer = csv.DictWriter(f, fieldnames=keys + RESULTS, extrasaction='ignore')
+        if new_table:
+            writer.writeheader()
+        futures = {executor.submit(run_config, config): config for config in configs}
+        for future in as_completed(futures):
+            result = future.result()
+            # rows are written as soon as a configuration finishes, so an interrupted sweep can be resumed
+            writer.writerow(result)
+            f.flush()
+            print("finished {}".format(config_key(futures[future], keys)))
@@ -0,0 +1,54 @@
+import os
+import shutil
+import threading
+
+import numpy as np
+import torch
+
+
+# write a checkpoint directory: state.pt for the small state and one .npy per array, so that large arrays
+# such as the replay memory can be memory-mapped back. The finished directory replaces the previous checkpoint
+# in one rename, an interrupted write leaves the previous checkpoint intact
+def write_checkpoint(path, state, arrays):
+    tmp_path = path + '.tmp'
+    old_path = path + '.old'
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+    for name, array in arrays.items():
+        np.save(os.path.join(tmp_path, name + '.npy'), array)
+    torch.save(state, os.path.join(tmp_path, 'state.pt'))
+    shutil.rmtree(old_path, ignore_errors=True)
+    if os.path.isdir(path):
+        os.replace(path, old_path)
+    os.replace(tmp_path, path)
+    shutil.rmtree(old_path, ignore_errors=True)
+
+
+# read a checkpoint written by write_checkpoint, (None, None) if there is none
+def read_checkpoint(path):
+    if not os.path.isdir(path):
+        # a crash between the two renames leaves only the previous checkpoint
+        path = path + '.old'
+        if not os.path.isdir(path):
+            return None, None
+    state = torch.load(os.path.join(path, 'state.pt'), weights_only=False)
+    arrays = {name[:-4]: np.load(os.path.join(path, name), mmap_mode='r') for name in os.listdir(path)
+              if name.endswith('.npy')}
+    return state, arrays
+
+
+# writes checkpoints in a background thread so that training goes on while they reach the disk,
+# a new checkpoint waits for the previous one to finish
+class CheckpointWriter(object):
+    def __init__(self):
+        self.thread = None
+
+    def write(self, path, state, arrays):
+        self.wait()
+        self.thread = threading.Thread(target=write_checkpoint, args=(path, state, arrays))
+        self.thread.start()
+
+    def wait(self):
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
@@ -1,17 +1,78 @@
+import hashlib
+import io
+import os
+
 import numpy as np
 
+TRAIN_TRACE = './data/SoDa_HC3-METEO_lat0.329_lon32.499_2005-01-01_2005-12-31_1833724734.csv'
+TEST_TRACE = './data/SoDa_HC3-METEO_lat0.329_lon32.499_2006-01-01_2006-12-31_1059619648.csv'
+TRACE_CACHE = './data/trace_cache'
+
+# short names of the SoDa/HelioClim columns, unknown columns are named after their header
+SODA_COLUMNS = {'Global Horiz': 'ghi', 'Clear-Sky': 'clear_sky', 'Top of Atmosphere': 'top_of_atmosphere',
+                'Code': 'code', 'Temperature': 'temperature', 'Relative Humidity': 'relative_humidity',
+                'Pressure': 'pressure', 'Wind speed': 'wind_speed', 'Wind direction': 'wind_direction',
+                'Rainfall': 'rainfall', 'Snowfall': 'snowfall', 'Snow depth': 'snow_depth'}
+
+
+# parse every column of a SoDa/HelioClim csv, 'time' holds the end of each hourly summarization period
+def parse_solar_trace(content):
+    lines = content.decode('utf-8').splitlines()
+    header = [line for line in lines if line.startswith('# Date;Time')][-1]
+    names = [name.strip(' ,') for name in header[2:].split(';')[2:]]
+    lines = [line for line in lines if not line.startswith('#') and ';' in line]
+    # numerical columns go through the C parser in one pass, the trailing commas are csv padding
+    body = '\n'.join(line[line.index(';', 11) + 1:].rstrip(',') for line in lines)
+    values = np.loadtxt(io.StringIO(body), delimiter=';', dtype=float, ndmin=2)
+    trace = {}
+    for i, name in enumerate(names):
+        trace[SODA_COLUMNS.get(name, name.lower().replace(' ', '_').replace('-', '_'))] = values[:, i]
+    date = np.array([line[:10] for line in lines], dtype='datetime64[D]')
+    hour = np.array([int(line[11:13]) for line in lines], dtype='timedelta64[h]')
+    trace['time'] = date + hour
+    return trace
+
+
+# load one trace file through the cache, the columns of a cached trace are memory-mapped read-only
+def load_trace_file(path, cache_dir):
+    with open(path, 'rb') as f:
+        content = f.read()
+    cache_path = os.path.join(cache_dir, hashlib.sha1(content).hexdigest())
+    if not os.path.isdir(cache_path):
+        trace = parse_solar_trace(content)
+        # write into a private directory first so that concurrent loaders never see a partial cache
+        tmp_path = '{}.{}.tmp'.format(cache_path, os.getpid())
+        os.makedirs(tmp_path, exist_ok=True)
+        for name, column in trace.items():
+            np.save(os.path.join(tmp_path, name + '.npy'), column)
+        try:
+            os.replace(tmp_path, cache_path)
+        except OSError:
+            # another process cached the same file in the meantime
+            for name in trace:
+                os.remove(os.path.join(tmp_path, name + '.npy'))
+            os.rmdir(tmp_path)
+    return {name[:-4]: np.load(os.path.join(cache_path, name), mmap_mode='r')
+            for name in sorted(os.listdir(cache_path))}
+
+
+# load a SoDa/HelioClim trace from a csv file or from a directory of yearly csv files joined in name order
+def load_solar_trace(path, cache_dir=TRACE_CACHE):
+    if not os.path.isdir(path):
+        return load_trace_file(path, cache_dir)
+    traces = [load_trace_file(os.path.join(path, name), cache_dir) for name in sorted(os.listdir(path))
+              if name.endswith('.csv')]
+    return {name: np.concatenate([trace[name] for trace in traces]) for name in traces[0]}
+
+
+def read_energy_data(is_train, path=None):
+    if path is None:
+        path = TRAIN_TRACE if is_train else TEST_TRACE
+    return load_solar_trace(path)['ghi']
+
 
-def read_energy_data(is_train):
-    if is_train:
-        with open('./data/SoDa_HC3-METEO_lat0.329_lon32.499_2005-01-01_2005-12-31_1833724734.csv', 'r') as f:
-            readlines = f.readlines()
-            result = list(readlines)[32:]
-
-    else:
-        with open('./data/SoDa_HC3-METEO_lat0.329_lon32.499_2006-01-01_2006-12-31_1059619648.csv', 'r') as f:
-            readlines = f.readlines()
-            result = list(readlines)[32:]
-    GHI = np.zeros(len(result))
-    for i in range(len(GHI)):
-        GHI[i] = int(result[i].split(";")[2])
-    return GHI
+# clear-sky GHI of the same trace as read_energy_data, the irradiance SoDa models for a cloudless sky
+def read_clear_sky(is_train, path=None):
+    if path is None:
+        path = TRAIN_TRACE if is_train else TEST_TRACE
+    return load_solar_trace(path)['clear_sky']
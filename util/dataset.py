@@ -0,0 +1,131 @@
+import json
+import os
+
+import numpy as np
+import torch
+
+# dtype of every logged field, states are (N, state_dim) and masks (N, action_dim)
+FIELDS = {'states': np.float32, 'actions': np.int64, 'rewards': np.float32, 'next_states': np.float32,
+          'dones': np.float32, 'masks': np.bool_, 'next_masks': np.bool_}
+
+
+# options the states and rewards of a dataset depend on, training on a dataset requires the same values
+SIMULATION_OPTIONS = ['lambda_r', 'tradeoff', 'panel_size', 'battery_size', 'core_number', 'frequency_set', 'kappa',
+                      'queue_size', 'forecast', 'forecast_horizons']
+
+
+# values of the simulation options in args as they are stored in meta.json
+def simulation_options(args):
+    options = {key: getattr(args, key) for key in SIMULATION_OPTIONS}
+    options['frequency_set'] = [float(frequency) for frequency in options['frequency_set']]
+    options['forecast_horizons'] = [int(horizon) for horizon in options['forecast_horizons']]
+    return options
+
+
+# appends transitions to one flat binary file per field of the dataset directory, meta.json is written last and
+# records the number of transitions, so a dataset is only readable once its writer has been closed
+class DatasetWriter():
+    def __init__(self, path, state_dim, action_dim, metadata, chunk=65536):
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self.metadata = metadata
+        self.width = {'states': state_dim, 'next_states': state_dim, 'masks': action_dim, 'next_masks': action_dim}
+        self.chunk = chunk
+        # transitions are staged in preallocated chunks and written with one call per field
+        self.staged = {name: np.zeros((chunk, self.width[name]) if name in self.width else (chunk,), dtype=dtype)
+                       for name, dtype in FIELDS.items()}
+        self.files = {name: open(os.path.join(path, name + '.bin'), 'wb') for name in FIELDS}
+        self.n_staged = 0
+        self.n_transitions = 0
+
+    def add(self, s0, a, r, s1, done, mask, next_mask):
+        index = self.n_staged
+        self.staged['states'][index] = s0
+        self.staged['actions'][index] = a
+        self.staged['rewards'][index] = r
+        self.staged['next_states'][index] = s1
+        self.staged['dones'][index] = done
+        self.staged['masks'][index] = mask
+        self.staged['next_masks'][index] = next_mask
+        self.n_staged += 1
+        if self.n_staged == self.chunk:
+            self.flush()
+
+    def flush(self):
+        for name, f in self.files.items():
+            f.write(self.staged[name][:self.n_staged].tobytes())
+        self.n_transitions += self.n_staged
+        self.n_staged = 0
+
+    def close(self):
+        self.flush()
+        for f in self.files.values():
+            f.close()
+        meta = dict(self.metadata)
+        meta.update({'n_transitions': self.n_transitions, 'state_dim': self.width['states'],
+                     'action_dim': self.width['masks']})
+        with open(os.path.join(self.path, 'meta.json'), 'w') as f:
+            json.dump(meta, f, indent=2)
+
+
+def read_meta(path):
+    with open(os.path.join(path, 'meta.json'), 'r') as f:
+        return json.load(f)
+
+
+# memory-mapped transitions of a dataset directory, with the sampling interface of the replay buffers.
+# minibatches are streamed from a shuffled window of block_count random blocks copied into RAM, so the file is read
+# sequentially and every transition is visited once per pass over the dataset
+class TransitionDataset():
+    def __init__(self, path, device, rng=None, block_size=8192, block_count=8):
+        self.meta = read_meta(path)
+        self.device = device
+        self.rng = rng if rng is not None else np.random.default_rng()
+        n = self.meta['n_transitions']
+        width = {'states': self.meta['state_dim'], 'next_states': self.meta['state_dim'],
+                 'masks': self.meta['action_dim'], 'next_masks': self.meta['action_dim']}
+        self.arrays = {name: np.memmap(os.path.join(path, name + '.bin'), dtype=dtype, mode='r',
+                                       shape=(n, width[name]) if name in width else (n,))
+                       for name, dtype in FIELDS.items()}
+        self.n_transitions = n
+        self.block_size = block_size
+        self.block_count = block_count
+        self.block_order = np.zeros(0, dtype=int)
+        self.window = None
+        self.window_order = np.zeros(0, dtype=int)
+        self.window_position = 0
+        self.passes = 0
+        # the dataset has no priorities, every transition weighs alike
+        self.last_weights = None
+        self.last_masks = None
+
+    # copy the next random blocks into RAM and shuffle them, starting a new pass once every block was read
+    def load_window(self):
+        if len(self.block_order) == 0:
+            self.block_order = self.rng.permutation(-(-self.n_transitions // self.block_size))
+            self.passes += 1
+        blocks, self.block_order = self.block_order[:self.block_count], self.block_order[self.block_count:]
+        self.window = {name: np.concatenate([array[block * self.block_size:(block + 1) * self.block_size]
+                                             for block in np.sort(blocks)])
+                       for name, array in self.arrays.items()}
+        self.window_order = self.rng.permutation(len(self.window['actions']))
+        self.window_position = 0
+
+    # next minibatch of the shuffled window, its masks are kept in last_masks
+    def sample(self, batch_size):
+        if self.window_position + batch_size > len(self.window_order):
+            self.load_window()
+        index = self.window_order[self.window_position:self.window_position + batch_size]
+        self.window_position += batch_size
+        self.last_masks = torch.from_numpy(self.window['masks'][index]).to(self.device)
+        return (torch.from_numpy(self.window['states'][index]).to(self.device),
+                torch.from_numpy(self.window['actions'][index]).to(self.device),
+                torch.from_numpy(self.window['rewards'][index]).to(self.device),
+                torch.from_numpy(self.window['next_states'][index]).to(self.device),
+                torch.from_numpy(self.window['dones'][index]).to(self.device))
+
+    def update_priorities(self, td_errors):
+        return
+
+    def size(self):
+        return self.n_transitions
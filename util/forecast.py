@@ -0,0 +1,24 @@
+import numpy as np
+
+# upper bound of the GHI (W/m^2), scales the lookahead features to [0, 1]
+SOLAR_CONSTANT = 1367.0
+FORECASTS = ['clear_sky', 'persistence', 'oracle']
+
+
+# lookahead features of every hour t of a GHI trace, one column per horizon k holding the GHI summed over the hours
+# t .. t+k-1 as predicted at t (Wh/m^2).
+# clear_sky sums the clear-sky GHI of the trace, which depends on the sun position only, persistence repeats the
+# profile of the last 24 hours, oracle sums the actual trace and bounds what any forecaster can give
+def forecast_features(GHI, method, horizons, clear_sky=None):
+    GHI = np.asarray(GHI, dtype=float)
+    n = len(GHI)
+    t = np.arange(n)[:, None]
+    horizons = np.asarray(horizons)[None, :]
+    if method == 'persistence':
+        # cumulative[t + 24] sums the hours before t, the hours before the start of the trace count as dark
+        cumulative = np.concatenate([np.zeros(25), np.cumsum(GHI)])
+        last_day = cumulative[t + 24] - cumulative[t]
+        return horizons // 24 * last_day + cumulative[t + horizons % 24] - cumulative[t]
+    predicted = np.asarray(clear_sky, dtype=float) if method == 'clear_sky' else GHI
+    cumulative = np.concatenate([[0], np.cumsum(predicted)])
+    return cumulative[np.minimum(t + horizons, n)] - cumulative[t]
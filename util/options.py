@@ -4,24 +4,176 @@
 
 import argparse
 
+from util.forecast import FORECASTS
 
-def args_parser():
+
+def args_parser(argv=None):
     parser = argparse.ArgumentParser()
     # simulation parameters
     parser.add_argument('--method', default='NAFA', help='scheduling method')
     parser.add_argument('--lambda_r', type=int, default=30, help='request arrival rate')
-    parser.add_argument('--panel_size', default=0.5, help='solar panel size')
+    parser.add_argument('--panel_size', type=float, default=0.5, help='solar panel size')
+    parser.add_argument('--battery_size', type=float, default=1e6, help='battery capacity')
+    parser.add_argument('--core_number', type=int, default=12, help='number of CPU cores of the edge server')
+    parser.add_argument('--frequency_set', type=float, nargs='+', default=[2e9, 3e9, 4e9],
+                        help='available core frequencies (Hz)')
+    parser.add_argument('--kappa', type=float, default=1e-28, help='effective switched capacitance of the cores')
     parser.add_argument('--tradeoff', type=float, default=3.0, help='tradeoff parameter')
+    parser.add_argument('--train_trace', default=None, help='SoDa solar trace file or directory for training')
+    parser.add_argument('--trace_path', default=None, help='file recording every request decision')
+    parser.add_argument('--queue_size', type=int, default=0,
+                        help='accepted requests which may wait for a busy core (0 rejects them)')
+    parser.add_argument('--queue_deadline', type=float, default=0.5,
+                        help='hours a request may wait before it is dropped')
+    parser.add_argument('--test_trace', default=None, help='SoDa solar trace file or directory for testing')
+    parser.add_argument('--forecast', default=None, choices=FORECASTS,
+                        help='append the solar energy forecast over the next hours to the state')
+    parser.add_argument('--forecast_horizons', type=int, nargs='+', default=[3, 12, 24],
+                        help='lookahead hours of the forecast features')
     # NAFA parameters
     parser.add_argument('--learning_rate', default=5e-4, help='NAFA learning rate')
     parser.add_argument('--update_tar_interval', default=5000, help='target network update periodicity')
     parser.add_argument('--batch_size', default=80, help='mini-batch size')
     parser.add_argument('--max_buff', default=1e6, help='replay memory size')
+    parser.add_argument('--prioritized_replay', action='store_true', help='sample replay memory by td error')
+    parser.add_argument('--buffer_memmap', default=None, help='directory of a disk-backed replay memory')
+    parser.add_argument('--dataset', default=None,
+                        help='directory of logged transitions, written by gen_dataset.py and read by offline training')
+    parser.add_argument('--behavior', default='BF', choices=['BF', 'WF'], help='policy logged by gen_dataset.py')
+    parser.add_argument('--behavior_epsilon', type=float, default=0.1,
+                        help='probability of a random valid action of the logged policy')
+    parser.add_argument('--offline_updates', type=int, default=100000,
+                        help='learning updates on the dataset before online training')
+    parser.add_argument('--offline_loss', default='dqn', choices=['dqn', 'bc'],
+                        help='offline objective: double DQN or behavior cloning of the logged actions')
+    parser.add_argument('--offline_only', action='store_true', help='train on the dataset without the simulator')
     parser.add_argument('--epsilon', default=0.5, help='initial epsilon')
     parser.add_argument('--epsilon_min', default=0.01, help='final epsilon')
     parser.add_argument('--eps_decay', default=30000, help='decay rate of epsilon')
     parser.add_argument('--discount', type=float, default=0.995, help='rewards discount')
     parser.add_argument('--print_interval', default=2000, help='print interval')
     parser.add_argument('--trial', default=1, help='trial number')
+    parser.add_argument('--seed', type=int, default=0, help='root seed, every trial draws independent streams of it')
+    parser.add_argument('--test_seed', type=int, default=0, help='seed of the testing request stream')
+    parser.add_argument('--profile', action='store_true', help='time the sections of the training loop')
+    parser.add_argument('--profiler', default=None, choices=['cprofile', 'torch'],
+                        help='profile a window of training frames')
+    parser.add_argument('--profile_start', type=int, default=10000, help='first profiled frame')
+    parser.add_argument('--profile_frames', type=int, default=2000, help='number of profiled frames')
+    parser.add_argument('--profile_output', default='data/profile', help='profile dump path without extension')
+    parser.add_argument('--resume', action='store_true', help='continue NAFA training from its last checkpoint')
+    parser.add_argument('--skip_train', '--skip-train', action='store_true',
+                        help='evaluate the saved model without training')
+    parser.add_argument('--fast_forward', action='store_true',
+                        help='evaluate BF and WF with the fast-forward simulation')
+    parser.add_argument('--inference', default='torch', choices=['torch', 'torchscript', 'numpy', 'table'],
+                        help='runtime of NAFA decisions during testing, table needs the output of distill.py')
+    parser.add_argument('--n_actors', type=int, default=0, help='simulator processes of the actor-learner mode')
+    parser.add_argument('--weight_sync_interval', type=int, default=200,
+                        help='learner updates between policy weight publications')
+    parser.add_argument('--actor_chunk', type=int, default=256, help='transitions per actor message')
+    parser.add_argument('--n_envs', type=int, default=1, help='number of simulations stepped in lockstep for training')
+    # cluster parameters
+    parser.add_argument('--n_nodes', type=int, default=1, help='number of edge servers of a cluster')
+    parser.add_argument('--dispatch', default='round_robin', choices=['round_robin', 'least_loaded', 'energy_aware'],
+                        help='policy dispatching the requests to the edge servers of a cluster')
+    parser.add_argument('--node_panel_size', type=float, nargs='+', default=None,
+                        help='solar panel size of every edge server of a cluster (panel_size if unset)')
+    parser.add_argument('--node_battery_size', type=float, nargs='+', default=None,
+                        help='battery size of every edge server of a cluster')
+    args = parser.parse_args(argv)
+    return args
+
+
+def sweep_args_parser():
+    parser = argparse.ArgumentParser()
+    # grid axes, a spec file overrides them
+    parser.add_argument('--spec', default=None, help='JSON or YAML file mapping options to a value or list of values')
+    parser.add_argument('--method', nargs='+', default=['NAFA', 'linUCB', 'BF', 'WF'], help='scheduling methods')
+    parser.add_argument('--lambda_r', type=int, nargs='+', default=[30], help='request arrival rates')
+    parser.add_argument('--tradeoff', type=float, nargs='+', default=[3.0], help='tradeoff parameters')
+    parser.add_argument('--trial', nargs='+', default=[1], help='trial numbers')
+    # execution parameters
+    parser.add_argument('--workers', type=int, default=None, help='number of worker processes (all cores if unset)')
+    parser.add_argument('--threads', type=int, default=1, help='torch threads per worker')
+    parser.add_argument('--output', default='data/sweep_results.csv', help='consolidated results table')
+    args = parser.parse_args()
+    return args
+
+
+def capacity_args_parser():
+    parser = argparse.ArgumentParser()
+    # hardware grid axes, a spec file overrides them (frequency_set is a list of frequency sets there)
+    parser.add_argument('--spec', default=None, help='JSON or YAML file mapping options to a value or list of values')
+    parser.add_argument('--panel_size', type=float, nargs='+', default=[0.5], help='solar panel sizes')
+    parser.add_argument('--battery_size', type=float, nargs='+', default=[1e6], help='battery capacities')
+    parser.add_argument('--core_number', type=int, nargs='+', default=[12], help='numbers of CPU cores')
+    parser.add_argument('--kappa', type=float, nargs='+', default=[1e-28], help='effective switched capacitances')
+    # policies and workload, NAFA and linUCB load the models trained for lambda_r, tradeoff and trial
+    parser.add_argument('--method', nargs='+', default=['BF', 'WF'], help='scheduling methods')
+    parser.add_argument('--lambda_r', type=int, nargs='+', default=[30], help='request arrival rates')
+    parser.add_argument('--tradeoff', type=float, nargs='+', default=[3.0], help='tradeoff parameters')
+    parser.add_argument('--trial', nargs='+', default=[1], help='trial numbers of the trained models')
+    parser.add_argument('--seed', type=int, nargs='+', default=[0], help='seeds of the shared request streams')
+    parser.add_argument('--days', type=int, default=300, help='simulated testing days')
+    # execution parameters
+    parser.add_argument('--workers', type=int, default=None, help='number of worker processes (all cores if unset)')
+    parser.add_argument('--cache', default='data/capacity_cache', help='directory of the per grid point results')
+    parser.add_argument('--output', default='data/capacity_results.csv', help='results table of the grid')
+    args = parser.parse_args()
+    return args
+
+
+def evaluate_args_parser():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--method', nargs='+', default=['NAFA', 'linUCB', 'BF', 'WF'], help='scheduling methods')
+    parser.add_argument('--lambda_r', type=int, default=30, help='request arrival rate')
+    parser.add_argument('--tradeoff', type=float, default=3.0, help='tradeoff parameter')
+    parser.add_argument('--trial', default=1, help='trial number of the trained NAFA and linUCB models')
+    parser.add_argument('--seed', type=int, default=0, help='first seed of the request streams')
+    parser.add_argument('--n_seeds', type=int, default=32, help='number of request streams per GHI window')
+    parser.add_argument('--window_days', type=int, default=300, help='days of every GHI window of the testing trace')
+    parser.add_argument('--n_windows', type=int, default=1, help='number of consecutive GHI windows')
+    parser.add_argument('--reference', default='BF', help='method the others are paired against')
+    parser.add_argument('--n_bootstrap', type=int, default=2000, help='bootstrap resamples')
+    parser.add_argument('--confidence', type=float, default=0.95, help='confidence level of the intervals')
+    parser.add_argument('--workers', type=int, default=None, help='number of worker processes (all cores if unset)')
+    parser.add_argument('--output', default='data/evaluation.csv', help='table of the metrics of every run')
+    parser.add_argument('--summary', default=None, help='JSON file receiving the means and intervals')
+    args = parser.parse_args()
+    return args
+
+
+def distill_args_parser():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--lambda_r', type=int, default=30, help='request arrival rate')
+    parser.add_argument('--tradeoff', type=float, default=3.0, help='tradeoff parameter')
+    parser.add_argument('--trial', default=1, help='trial number of the distilled NAFA model')
+    parser.add_argument('--forecast', default=None, choices=FORECASTS,
+                        help='forecast features the model was trained with')
+    parser.add_argument('--forecast_horizons', type=int, nargs='+', default=[3, 12, 24],
+                        help='lookahead hours of the forecast features')
+    # quantization of the table, the running instances get one bin per count
+    parser.add_argument('--hour_bins', type=int, default=24, help='bins of the hour of the day')
+    parser.add_argument('--battery_bins', type=int, default=16, help='bins of the battery level')
+    parser.add_argument('--reservation_bins', type=int, default=16, help='bins of the reserved energy')
+    parser.add_argument('--size_bins', type=int, default=8, help='bins of the request data size')
+    parser.add_argument('--episodes', type=int, default=10, help='monthly training windows the table is fit on')
+    parser.add_argument('--test_days', type=int, default=300, help='testing days of the agreement and reward report')
+    parser.add_argument('--output', default=None, help='table file (data/table_<lambda_r>_<tradeoff>_<trial>.npz)')
+    args = parser.parse_args()
+    return args
+
+
+def benchmark_args_parser():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--lambda_r', type=int, nargs='+', default=[10, 30], help='request arrival rates')
+    parser.add_argument('--days', type=int, nargs='+', default=[1, 10], help='simulated episode lengths (days)')
+    parser.add_argument('--n_decisions', type=int, default=2000, help='timed decisions per agent')
+    parser.add_argument('--n_updates', type=int, default=200, help='timed NAFA learning updates')
+    parser.add_argument('--seed', type=int, default=0, help='random seed')
+    parser.add_argument('--output', default=None, help='JSON file receiving the results')
+    parser.add_argument('--baseline', default=None, help='JSON results to compare against')
+    parser.add_argument('--threshold', type=float, default=0.2, help='tolerated relative slowdown')
     args = parser.parse_args()
     return args
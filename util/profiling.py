@@ -0,0 +1,75 @@
+import cProfile
+import time
+
+
+# accumulates wall time and call counts of named sections of the training loop, per print interval and per episode.
+# When disabled tic returns 0 and toc returns at once, so the instrumented code pays two cheap calls per section
+class SectionTimer(object):
+    def __init__(self, enabled):
+        self.enabled = enabled
+        self.interval = {}
+        self.episode = {}
+
+    def tic(self):
+        if not self.enabled:
+            return 0
+        return time.perf_counter()
+
+    def toc(self, name, start):
+        if not self.enabled:
+            return
+        elapsed = time.perf_counter() - start
+        for scope in (self.interval, self.episode):
+            total, count = scope.get(name, (0.0, 0))
+            scope[name] = (total + elapsed, count + 1)
+
+    # summary of one scope ('interval' or 'episode') sorted by total time, the scope is cleared afterwards
+    def report(self, scope):
+        sections = getattr(self, scope)
+        setattr(self, scope, {})
+        if not self.enabled or not sections:
+            return ''
+        lines = ['{} timing (seconds total / microseconds per call / calls):'.format(scope)]
+        for name, (total, count) in sorted(sections.items(), key=lambda item: -item[1][0]):
+            lines.append('  {:<16s} {:10.3f} {:10.1f} {:10d}'.format(name, total, total / count * 1e6, count))
+        return '\n'.join(lines)
+
+
+# profiles the frames [start, start + n_frames) with cProfile or torch.profiler and dumps the result to output
+class ProfileWindow(object):
+    def __init__(self, kind, start, n_frames, output):
+        self.kind = kind
+        self.start = start
+        self.stop = start + n_frames
+        self.output = output
+        self.profiler = None
+
+    def on_frame(self, fr):
+        if self.kind is None:
+            return
+        if fr == self.start:
+            self.begin()
+        elif fr == self.stop:
+            self.end()
+
+    def begin(self):
+        if self.kind == 'cprofile':
+            self.profiler = cProfile.Profile()
+            self.profiler.enable()
+        else:
+            import torch.profiler
+            self.profiler = torch.profiler.profile(activities=[torch.profiler.ProfilerActivity.CPU])
+            self.profiler.__enter__()
+
+    def end(self):
+        if self.profiler is None:
+            return
+        if self.kind == 'cprofile':
+            self.profiler.disable()
+            self.profiler.dump_stats(self.output + '.prof')
+        else:
+            self.profiler.__exit__(None, None, None)
+            self.profiler.export_chrome_trace(self.output + '.json')
+            print(self.profiler.key_averages().table(sort_by='cpu_time_total', row_limit=20))
+        print('profile of frames [{}, {}) written to {}'.format(self.start, self.stop, self.output))
+        self.profiler = None
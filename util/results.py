@@ -0,0 +1,49 @@
+import json
+import os
+import uuid
+
+import numpy as np
+
+RESULTS_DIR = './data/results'
+# per-day statistics recorded by the environment for every run
+DAY_METRICS = ['n_reject_low_power', 'n_reject_conservation', 'n_reject_high_latency', 'total_latency',
+               'n_total_request', 'day_rewards']
+# per-day statistics of the waiting queue, recorded only when it is enabled
+QUEUE_METRICS = ['n_queued', 'n_reject_deadline', 'total_queue_delay']
+
+
+# append one run to the results store: its per-day arrays go into a new .npz shard and its metadata
+# into one line of index.jsonl, so concurrent writers never touch the same file
+def save_run(env, metadata, path=RESULTS_DIR):
+    os.makedirs(path, exist_ok=True)
+    run_id = uuid.uuid4().hex
+    shard = os.path.join(path, run_id + '.npz')
+    tmp_shard = os.path.join(path, run_id + '.tmp.npz')
+    metrics = DAY_METRICS + QUEUE_METRICS if getattr(env, 'queue_size', 0) else DAY_METRICS
+    np.savez(tmp_shard, **{name: getattr(env, name) for name in metrics})
+    os.replace(tmp_shard, shard)
+    record = dict(metadata, run_id=run_id)
+    # a single write on a file opened for appending keeps concurrent index lines whole
+    with open(os.path.join(path, 'index.jsonl'), 'a') as f:
+        f.write(json.dumps(record, default=str) + '\n')
+    return run_id
+
+
+# metadata of the runs whose fields equal the given filters, e.g. load_index(method='NAFA', lambda_r=30)
+def load_index(path=RESULTS_DIR, **filters):
+    index_path = os.path.join(path, 'index.jsonl')
+    if not os.path.exists(index_path):
+        return []
+    with open(index_path, 'r') as f:
+        records = [json.loads(line) for line in f if line.strip()]
+    return [record for record in records
+            if all(str(record.get(key)) == str(value) for key, value in filters.items())]
+
+
+# metadata and per-day arrays of the matching runs, only their shards are read
+def load_runs(path=RESULTS_DIR, **filters):
+    runs = []
+    for record in load_index(path, **filters):
+        with np.load(os.path.join(path, record['run_id'] + '.npz')) as shard:
+            runs.append(dict(record, **{name: shard[name] for name in shard.files}))
+    return runs
@@ -0,0 +1,27 @@
+import zlib
+
+import numpy as np
+
+# streams of the components of one run, every (seed, trial, stream) names an independent SeedSequence
+ENV_STREAM = 0
+AGENT_STREAM = 1
+# actor i of the actor-learner mode uses ACTOR_STREAM + i
+ACTOR_STREAM = 2
+
+
+# trial numbers are usually integers, other trial names are hashed
+def trial_key(trial):
+    try:
+        return int(trial)
+    except (TypeError, ValueError):
+        return zlib.crc32(str(trial).encode())
+
+
+# SeedSequence of one stream of the run configured by args, trials of the same seed get independent streams
+def seed_sequence(args, stream):
+    return np.random.SeedSequence(args.seed, spawn_key=(trial_key(args.trial), stream))
+
+
+# seed of a torch generator drawn from a SeedSequence
+def torch_seed(sequence):
+    return int(sequence.generate_state(1, np.uint64)[0])
@@ -0,0 +1,76 @@
+import atexit
+import queue
+import threading
+
+import numpy as np
+
+# reject reasons, matching the rejection counters of the environment
+ACCEPTED = 0
+REJECT_LOW_POWER = 1
+REJECT_CONSERVATION = 2
+REJECT_HIGH_LATENCY = 3
+# accepted into the waiting queue but dropped at its deadline, recorded when dropped
+REJECT_DEADLINE = 4
+
+# one record per request, battery/reservation/running instances are taken before the action is applied
+TRACE_DTYPE = np.dtype([('episode', np.int32), ('time', np.float64), ('data_size', np.float64),
+                        ('battery', np.float64), ('reservation', np.float64), ('running_instance', np.int32),
+                        ('action', np.int8), ('reject_reason', np.int8), ('latency', np.float64),
+                        ('reward', np.float64)])
+
+
+# records every request into preallocated chunks, full chunks are appended to a raw binary file by a
+# background thread so that the simulation never waits for the disk
+class RequestTraceRecorder(object):
+    def __init__(self, path, chunk_size=1 << 16):
+        self.path = path
+        self.chunk_size = chunk_size
+        self.chunk = np.zeros(chunk_size, dtype=TRACE_DTYPE)
+        self.n_record = 0
+        self.episode = -1
+        self.file = open(path, 'wb')
+        self.pending = queue.Queue()
+        self.writer = threading.Thread(target=self.write_chunks, daemon=True)
+        self.writer.start()
+        atexit.register(self.close)
+
+    def write_chunks(self):
+        while True:
+            chunk = self.pending.get()
+            if chunk is None:
+                break
+            self.file.write(chunk.tobytes())
+
+    def new_episode(self):
+        self.episode += 1
+
+    def record(self, time, data_size, battery, reservation, running_instance, action, reject_reason, latency,
+               reward):
+        self.chunk[self.n_record] = (self.episode, time, data_size, battery, reservation, running_instance, action,
+                                     reject_reason, latency, reward)
+        self.n_record += 1
+        if self.n_record == self.chunk_size:
+            self.flush()
+
+    # hand the filled part of the current chunk to the writer and start a fresh chunk
+    def flush(self):
+        if self.n_record == 0:
+            return
+        self.pending.put(self.chunk[:self.n_record])
+        self.chunk = np.zeros(self.chunk_size, dtype=TRACE_DTYPE)
+        self.n_record = 0
+
+    def close(self):
+        if self.file.closed:
+            return
+        self.flush()
+        self.pending.put(None)
+        self.writer.join()
+        self.file.close()
+
+
+# read a trace file back as a structured array, optionally memory-mapped
+def read_trace(path, mmap=False):
+    if mmap:
+        return np.memmap(path, dtype=TRACE_DTYPE, mode='r')
+    return np.fromfile(path, dtype=TRACE_DTYPE)